@@ -57,6 +57,7 @@ export default function ChatPage() {
   const [newRoomName, setNewRoomName] = useState('');
   const [newRoomType, setNewRoomType] = useState('one_on_one');
   const [websocket, setWebsocket] = useState<WebSocket | null>(null);
+  const [onlineUserIds, setOnlineUserIds] = useState<number[]>([]);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const [activeCallId, setActiveCallId] = useState<number | null>(null);
   const [incomingCall, setIncomingCall] = useState<{ id: number; caller: string; audioOnly?: boolean } | null>(null);
@@ -135,7 +136,8 @@ export default function ChatPage() {
         participant_ids: [tutor.id]
       });
       
-      setRooms(prev => [...prev, response.data]);
+      // An existing one-on-one room with this tutor is returned instead of a new one
+      setRooms(prev => prev.some(r => r.id === response.data.id) ? prev : [...prev, response.data]);
       setSelectedRoom(response.data);
       setShowTutorModal(false);
     } catch (error) {
@@ -160,7 +162,8 @@ export default function ChatPage() {
     try {
       setLoadingMessages(true);
       const response = await chatAPI.getMessages(roomId);
-      setMessages(response.data);
+      setMessages(response.data.results);
+      chatAPI.markRoomRead(roomId).catch(() => {});
     } catch (error) {
       console.error('Error fetching messages:', error);
     } finally {
@@ -181,12 +184,30 @@ export default function ChatPage() {
     console.log('Connecting to WebSocket:', wsUrl);
     const ws = new WebSocket(wsUrl);
     setWebsocket(ws);
+    setOnlineUserIds([]);
+
+    // Presence expires server-side after 60s without a heartbeat
+    const heartbeat = setInterval(() => {
+      if (ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ action: 'heartbeat' }));
+      }
+    }, 25000);
 
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
       console.log('WebSocket message received:', data);
       
-      if (data.type === 'chat_message') {
+      if (data.action === 'presence') {
+        setOnlineUserIds(data.online);
+      } else if (data.action === 'rate_limited') {
+        // The server dropped frames (heartbeats are all we send here): back off, then resend so presence doesn't lapse
+        console.warn('WebSocket rate limited, resending heartbeat shortly');
+        setTimeout(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ action: 'heartbeat' }));
+          }
+        }, 2000);
+      } else if (data.type === 'chat_message') {
         setMessages(prev => [...prev, data.message]);
         scrollToBottom();
       } else if (data.type === 'call_notification') {
@@ -206,6 +227,7 @@ export default function ChatPage() {
     };
 
     ws.onclose = () => {
+      clearInterval(heartbeat);
       console.log('WebSocket disconnected');
       // Reconnect logic could be added here
     };
@@ -225,7 +247,7 @@ export default function ChatPage() {
         participants: newRoomType === 'group' ? selectedParticipants : []
       });
       
-      setRooms(prev => [...prev, response.data]);
+      setRooms(prev => prev.some(r => r.id === response.data.id) ? prev : [...prev, response.data]);
       setShowCreateRoom(false);
       setNewRoomName('');
       setSelectedParticipants([]);
@@ -237,7 +259,7 @@ export default function ChatPage() {
   const handleCreateSupportChat = async () => {
     try {
       const response = await chatAPI.createSupportChat();
-      setRooms(prev => [...prev, response.data]);
+      setRooms(prev => prev.some(r => r.id === response.data.id) ? prev : [...prev, response.data]);
       setSelectedRoom(response.data);
     } catch (error) {
       console.error('Error creating support chat:', error);
@@ -446,7 +468,9 @@ export default function ChatPage() {
                     <div>
                       <h3 className="text-lg font-semibold text-gray-900">{selectedRoom.name}</h3>
                       <p className="text-sm text-gray-500">
-                        {selectedRoom.participants.map(p => p.first_name).join(', ')}
+                        {selectedRoom.participants
+                          .map(p => onlineUserIds.includes(p.id) ? `${p.first_name} (online)` : p.first_name)
+                          .join(', ')}
                       </p>
                     </div>
                     <div className="flex space-x-2">
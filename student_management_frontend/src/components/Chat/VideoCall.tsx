@@ -23,6 +23,9 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
   const peerConnections = useRef<Map<string, RTCPeerConnection>>(new Map());
   const wsRef = useRef<WebSocket | null>(null);
   const iceCandidatesQueues = useRef<Map<string, RTCIceCandidate[]>>(new Map());
+  // Local candidates per target, sent as one 'ice-candidates' frame per burst
+  const outgoingCandidates = useRef<Map<string, RTCIceCandidateInit[]>>(new Map());
+  const candidateFlushTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
 
   const ICE_SERVERS = {
     iceServers: [
@@ -125,13 +128,8 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
 
       // Handle ICE candidates
       pc.onicecandidate = (event) => {
-        if (event.candidate && wsRef.current?.readyState === WebSocket.OPEN) {
-          wsRef.current.send(JSON.stringify({
-            action: 'ice-candidate',
-            candidate: event.candidate,
-            target: targetUsername, // Target the specific user
-            username: currentUser.username
-          }));
+        if (event.candidate) {
+          queueCandidate(targetUsername, event.candidate.toJSON());
         }
       };
 
@@ -149,6 +147,45 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
     }
   };
 
+  const flushCandidates = () => {
+    candidateFlushTimer.current = null;
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      outgoingCandidates.current.forEach((candidates, target) => {
+        wsRef.current?.send(JSON.stringify({
+          action: 'ice-candidates',
+          candidates,
+          target, // Target the specific user
+          username: currentUser.username
+        }));
+      });
+    }
+    outgoingCandidates.current.clear();
+  };
+
+  const queueCandidate = (targetUsername: string, candidate: RTCIceCandidateInit) => {
+    const pending = outgoingCandidates.current.get(targetUsername) || [];
+    pending.push(candidate);
+    outgoingCandidates.current.set(targetUsername, pending);
+    if (!candidateFlushTimer.current) {
+      candidateFlushTimer.current = setTimeout(flushCandidates, 25);
+    }
+  };
+
+  const addRemoteCandidate = async (username: string, candidateInit: RTCIceCandidateInit) => {
+    const pc = peerConnections.current.get(username);
+    const candidate = new RTCIceCandidate(candidateInit);
+    if (pc && pc.remoteDescription && pc.remoteDescription.type) {
+        await pc.addIceCandidate(candidate);
+    } else {
+        let queue = iceCandidatesQueues.current.get(username);
+        if (!queue) {
+            queue = [];
+            iceCandidatesQueues.current.set(username, queue);
+        }
+        queue.push(candidate);
+    }
+  };
+
   const removeParticipant = (username: string) => {
     const pc = peerConnections.current.get(username);
     if (pc) {
@@ -186,6 +223,12 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
   };
 
   const handleSignalMessage = async (data: any, localStream: MediaStream) => {
+    if (data.action === 'rate_limited') {
+      // Some of our signalling frames were dropped; the peers may need a moment (or a rejoin) to connect
+      console.warn('Signalling rate limited by the server, some frames were dropped');
+      return;
+    }
+
     // Ignore own messages
     if (data.username === currentUser.username) return;
 
@@ -245,17 +288,10 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
             }
         }
       } else if (data.action === 'ice-candidate') {
-        const pc = peerConnections.current.get(data.username);
-        const candidate = new RTCIceCandidate(data.candidate);
-        if (pc && pc.remoteDescription && pc.remoteDescription.type) {
-            await pc.addIceCandidate(candidate);
-        } else {
-            let queue = iceCandidatesQueues.current.get(data.username);
-            if (!queue) {
-                queue = [];
-                iceCandidatesQueues.current.set(data.username, queue);
-            }
-            queue.push(candidate);
+        await addRemoteCandidate(data.username, data.candidate);
+      } else if (data.action === 'ice-candidates') {
+        for (const candidate of data.candidates) {
+          await addRemoteCandidate(data.username, candidate);
         }
       } else if (data.action === 'user_left') {
         removeParticipant(data.username);
@@ -276,6 +312,11 @@ const VideoCall: React.FC<VideoCallProps> = ({ callId, isInitiator, onClose, cur
       }));
     }
 
+    if (candidateFlushTimer.current) {
+      clearTimeout(candidateFlushTimer.current);
+      candidateFlushTimer.current = null;
+    }
+    outgoingCandidates.current.clear();
     peerConnections.current.forEach(pc => pc.close());
     peerConnections.current.clear();
     
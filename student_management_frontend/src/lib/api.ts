@@ -255,10 +255,24 @@ export const earningsAPI = {
 export const chatAPI = {
   getRooms: () => 
     apiClient.get('/chat/rooms/'),
+  getInbox: (page: number = 1) =>
+    apiClient.get('/chat/inbox/', { params: { page } }),
   createRoom: (data: any) => 
     apiClient.post('/chat/rooms/create/', data),
-  getMessages: (roomId: number) => 
-    apiClient.get(`/chat/rooms/${roomId}/messages/`),
+  getMessages: (roomId: number, params?: { before?: number; after?: number; limit?: number }) => 
+    apiClient.get(`/chat/rooms/${roomId}/messages/`, { params }),
+  markRoomRead: (roomId: number, messageId?: number) =>
+    apiClient.post(`/chat/rooms/${roomId}/read/`, messageId ? { message_id: messageId } : {}),
+  markRoomsRead: (roomIds?: number[]) =>
+    apiClient.post('/chat/rooms/read/', roomIds ? { room_ids: roomIds } : {}),
+  getUnread: () =>
+    apiClient.get('/chat/unread/'),
+  searchMessages: (q: string, params?: { room_id?: number; before?: number; limit?: number }) =>
+    apiClient.get('/chat/messages/search/', { params: { q, ...params } }),
+  getRoomPresence: (roomId: number) =>
+    apiClient.get(`/chat/rooms/${roomId}/presence/`),
+  getPresence: (userIds: number[]) =>
+    apiClient.get('/chat/presence/', { params: { user_ids: userIds.join(',') } }),
   createSupportChat: () => 
     apiClient.post('/chat/rooms/support/'),
   sendMessage: (roomId: number, data: any) => 
@@ -344,7 +344,8 @@ class StudentDashboardView(APIView):
         from courses.models import Enrollment
         from quizzes.models import QuizAttempt
         from interviews.models import InterviewBooking
-        from chat.models import Message
+        from chat.models import RoomReadState
+        from django.db.models import Sum
         
         # Stats
         enrolled_courses = Enrollment.objects.filter(student=user, is_active=True).count()
@@ -358,11 +359,8 @@ class StudentDashboardView(APIView):
             is_confirmed=True
         ).count()
         
-        # Unread messages
-        unread_messages = Message.objects.filter(
-            room__participants=user,
-            is_read=False
-        ).exclude(sender=user).count()
+        # Unread messages (counters maintained by chat.unread)
+        unread_messages = RoomReadState.objects.filter(user=user).aggregate(total=Sum('unread_count'))['total'] or 0
         
         data = {
             'stats': [
@@ -0,0 +1,77 @@
+"""
+Video call analytics, aggregated in the database.
+
+Per user and calendar month: calls made and received, minutes talked
+(completed calls, either side) and how many received calls were missed.
+Two grouped queries (one per side of the call) are merged here; results
+are cached for CALL_ANALYTICS_CACHE_SECONDS since call statuses keep
+changing for a while after the call (ended, swept to missed).
+"""
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import VideoCall
+
+
+def months_ago_start(months, now=None):
+    """First instant of the month `months - 1` before the current one"""
+    now = timezone.localtime(now or timezone.now())
+    year, month = divmod(now.year * 12 + now.month - 1 - (months - 1), 12)
+    return timezone.make_aware(datetime(year, month + 1, 1))
+
+
+def _side(queryset, user_field):
+    return (
+        queryset.annotate(month=TruncMonth('created_at')).order_by()
+        .values('month', user_field, f'{user_field}__username')
+        .annotate(
+            calls=Count('id'),
+            seconds=Sum('duration', filter=Q(status='completed')),
+            missed=Count('id', filter=Q(status='missed')),
+        )
+    )
+
+
+def call_analytics(months=12, user_id=None):
+    """Rows of {month, user_id, username, calls_made, calls_received, minutes, missed, missed_rate}, newest month first"""
+    key = f'call_analytics:{months}:{user_id or "all"}'
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    calls = VideoCall.objects.filter(created_at__gte=months_ago_start(months))
+    made, received = calls, calls.filter(receiver__isnull=False)
+    if user_id:
+        made, received = made.filter(caller_id=user_id), received.filter(receiver_id=user_id)
+
+    cells = {}
+
+    def cell(row, user_field):
+        month = timezone.localtime(row['month']).date()
+        return cells.setdefault((month, row[user_field]), {
+            'month': month, 'user_id': row[user_field], 'username': row[f'{user_field}__username'],
+            'calls_made': 0, 'calls_received': 0, 'seconds': 0, 'missed': 0,
+        })
+
+    for row in _side(made, 'caller'):
+        entry = cell(row, 'caller')
+        entry['calls_made'] += row['calls']
+        entry['seconds'] += row['seconds'] or 0
+    for row in _side(received, 'receiver'):
+        entry = cell(row, 'receiver')
+        entry['calls_received'] += row['calls']
+        entry['seconds'] += row['seconds'] or 0
+        entry['missed'] += row['missed']
+
+    rows = []
+    for entry in sorted(cells.values(), key=lambda entry: (entry['month'], entry['user_id']), reverse=True):
+        seconds = entry.pop('seconds')
+        entry['minutes'] = round(seconds / 60, 1)
+        entry['missed_rate'] = round(entry['missed'] / entry['calls_received'], 3) if entry['calls_received'] else None
+        rows.append(entry)
+
+    cache.set(key, rows, getattr(settings, 'CALL_ANALYTICS_CACHE_SECONDS', 600))
+    return rows
@@ -0,0 +1,159 @@
+"""
+Cold storage for old chat messages.
+
+archive_messages() moves every message from a calendar month that ended more
+than CHAT_ARCHIVE_AFTER_DAYS ago out of Message and into one
+MessageArchiveSegment per room and month: a zlib-compressed JSON blob plus
+its id and timestamp range. Only whole months are archived, so the hot table
+always holds a room's newest messages and everything archived is older.
+
+MessageListCreateView keeps paging past the oldest hot message into the
+segments (archived_before / archived_after), so clients don't notice the
+split. Search, the inbox preview and unread counts only look at hot messages.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from accounts.models import User
+from .models import Message, MessageArchiveSegment
+
+ARCHIVED_FIELDS = ('id', 'sender_id', 'content', 'timestamp', 'is_read')
+
+
+def encode_rows(rows):
+    return zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder, separators=(',', ':')).encode())
+
+
+def decode_rows(data):
+    rows = json.loads(zlib.decompress(bytes(data)))
+    for row in rows:
+        row['timestamp'] = parse_datetime(row['timestamp'])
+    return rows
+
+
+def _month_bounds(month):
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    following = (start.replace(tzinfo=None) + timedelta(days=32)).replace(day=1)
+    return start, timezone.make_aware(following)
+
+
+def archive_cutoff(older_than_days=None, now=None):
+    """Start of the oldest month that stays hot"""
+    days = older_than_days if older_than_days is not None else getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 180)
+    edge = timezone.localtime(now or timezone.now()) - timedelta(days=days)
+    return _month_bounds(edge.date())[0]
+
+
+def archive_messages(older_than_days=None, now=None, dry_run=False, log=None):
+    """Archive whole months older than the cutoff, one transaction per room and month"""
+    cutoff = archive_cutoff(older_than_days, now)
+    months = (
+        Message.objects.filter(timestamp__lt=cutoff)
+        .annotate(month=TruncMonth('timestamp')).order_by()
+        .values_list('room_id', 'month').distinct()
+    )
+    result = {'segments': 0, 'messages': 0}
+    for room_id, month in sorted(months, key=lambda pair: (pair[1], pair[0])):
+        month = timezone.localtime(month).date() if isinstance(month, datetime) else month
+        if dry_run:
+            start, end = _month_bounds(month)
+            count = Message.objects.filter(room_id=room_id, timestamp__gte=start, timestamp__lt=end).count()
+        else:
+            count = archive_room_month(room_id, month)
+        if log:
+            log(f'room {room_id} {month:%Y-%m}: {count} messages')
+        result['segments'] += 1
+        result['messages'] += count
+    return result
+
+
+def archive_room_month(room_id, month):
+    start, end = _month_bounds(month)
+    with transaction.atomic():
+        hot = Message.objects.filter(room_id=room_id, timestamp__gte=start, timestamp__lt=end)
+        rows = list(hot.select_for_update().order_by('timestamp', 'id').values(*ARCHIVED_FIELDS))
+        if not rows:
+            return 0
+        moved = len(rows)
+        segment = (
+            MessageArchiveSegment.objects.select_for_update().filter(room_id=room_id, month=start.date()).first()
+        )
+        if segment:
+            # Messages left behind by an earlier run are merged into the same segment
+            rows = sorted(decode_rows(segment.data) + rows, key=lambda row: (row['timestamp'], row['id']))
+        else:
+            segment = MessageArchiveSegment(room_id=room_id, month=start.date())
+        segment.data = encode_rows(rows)
+        segment.message_count = len(rows)
+        segment.first_message_id = min(row['id'] for row in rows)
+        segment.last_message_id = max(row['id'] for row in rows)
+        segment.first_timestamp = rows[0]['timestamp']
+        segment.last_timestamp = rows[-1]['timestamp']
+        segment.save()
+        hot.delete()
+    return moved
+
+
+def _segments(room_id, newest_first, key=None):
+    """Yield the rows of the room's segments, loading one blob at a time"""
+    segments = MessageArchiveSegment.objects.filter(room_id=room_id)
+    if key:
+        month = timezone.localtime(key[0]).date().replace(day=1)
+        segments = segments.filter(month__lte=month) if newest_first else segments.filter(month__gte=month)
+    for segment_id in segments.order_by('-month' if newest_first else 'month').values_list('id', flat=True):
+        data = MessageArchiveSegment.objects.filter(id=segment_id).values_list('data', flat=True).first()
+        if data is not None:
+            yield decode_rows(data)
+
+
+def find_archived(room_id, message_id):
+    """(timestamp, id) of an archived message, or None"""
+    candidates = MessageArchiveSegment.objects.filter(
+        room_id=room_id, first_message_id__lte=message_id, last_message_id__gte=message_id
+    ).values_list('data', flat=True)
+    for data in candidates:
+        for row in decode_rows(data):
+            if row['id'] == message_id:
+                return row['timestamp'], row['id']
+    return None
+
+
+def _collect(room_id, count, newest_first, key):
+    rows = []
+    for segment_rows in _segments(room_id, newest_first, key):
+        if newest_first:
+            segment_rows.reverse()
+            segment_rows = [row for row in segment_rows if not key or (row['timestamp'], row['id']) < key]
+        else:
+            segment_rows = [row for row in segment_rows if not key or (row['timestamp'], row['id']) > key]
+        rows.extend(segment_rows)
+        if len(rows) >= count:
+            break
+    return rows[:count]
+
+
+def _as_messages(room_id, rows):
+    """Unsaved Message instances for MessageSerializer; messages of deleted users are dropped like hot ones"""
+    senders = User.objects.in_bulk({row['sender_id'] for row in rows})
+    messages = []
+    for row in rows:
+        sender = senders.get(row['sender_id'])
+        if sender:
+            messages.append(Message(room_id=room_id, sender=sender, **{field: row[field] for field in ARCHIVED_FIELDS if field != 'sender_id'}))
+    return messages
+
+
+def archived_before(room_id, key, count):
+    """Up to `count` archived messages older than key=(timestamp, id) (all, if key is None), newest first"""
+    return _as_messages(room_id, _collect(room_id, count, True, key))
+
+
+def archived_after(room_id, key, count):
+    """Up to `count` archived messages newer than key=(timestamp, id), oldest first"""
+    return _as_messages(room_id, _collect(room_id, count, False, key))
@@ -0,0 +1,111 @@
+"""
+Write-behind buffer for chat messages received over websockets.
+
+Consumers hand messages to the process-wide `message_buffer`, which inserts
+them with one bulk_create every CHAT_WRITE_FLUSH_MS milliseconds or
+CHAT_WRITE_BATCH_SIZE messages, whichever comes first. With
+CHAT_DURABLE_BEFORE_ACK the consumer waits for its message's flush before
+broadcasting it; otherwise it broadcasts right away and a crash can lose at
+most the last flush interval of messages.
+"""
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from .models import Message
+from .unread import record_new_messages
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(settings, 'CHAT_WRITE_FLUSH_MS', 20) / 1000
+        self._pending = []  # (Message, future or None)
+        self._timer = None
+        self._lock = None
+        self._flushes = set()  # background flush tasks, referenced until done
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, room_id, sender_id, content, wait=False):
+        """Queue a message; with wait=True return the saved Message once it has been flushed"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future() if wait else None
+        self._pending.append((Message(room_id=room_id, sender_id=sender_id, content=content), future))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush_in_background(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_in_background, loop)
+
+        if future:
+            return await future
+        return None
+
+    def _flush_in_background(self, loop):
+        task = loop.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._flushes.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error('Background flush of chat messages failed', exc_info=task.exception())
+
+    async def flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # One flush at a time keeps batches in arrival order
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                results = await database_sync_to_async(self._write)([message for message, _ in batch])
+            except Exception as error:
+                # Not even the row by row fallback ran: fail every waiting sender rather than leave it hanging
+                for _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(error)
+                raise
+            for (message, future), error in zip(batch, results):
+                if future is None or future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(message)
+            return len(batch)
+
+    @staticmethod
+    def _write(messages):
+        """Insert the batch; if it fails as a whole, fall back to row by row so one bad row only loses itself"""
+        try:
+            Message.objects.bulk_create(messages)
+        except DatabaseError:
+            logger.exception('Bulk insert of %d chat messages failed, retrying one by one', len(messages))
+        else:
+            record_new_messages(messages)
+            return [None] * len(messages)
+
+        results = []
+        for message in messages:
+            try:
+                message.pk = None
+                message.save(force_insert=True)
+                results.append(None)
+            except DatabaseError as error:
+                logger.exception('Dropping chat message for room %s', message.room_id)
+                results.append(error)
+        record_new_messages([message for message, error in zip(messages, results) if not error])
+        return results
+
+
+message_buffer = MessageWriteBuffer()
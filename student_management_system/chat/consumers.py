@@ -1,12 +1,54 @@
-import json
+import asyncio
+import time
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Room, Message, VideoCall
+from student_management.websocket import EncodedWebsocketMixin, with_frames
+from .buffer import message_buffer
+from .unread import mark_read
+from . import membership, presence
 
 User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def chat_message_payload(event):
+    """What clients receive for a 'chat_message' group event"""
+    response_data = {
+        'message': event['message'],
+        'username': event['username'],
+        'user_id': event.get('user_id', None)
+    }
+    
+    # Add optional fields if present
+    for field in ('call_id', 'action', 'message_id'):
+        if field in event:
+            response_data[field] = event[field]
+    return response_data
+
+def read_receipt_payload(event):
+    return {
+        'action': 'read_receipt',
+        'user_id': event['user_id'],
+        'username': event['username'],
+        'last_read_message_id': event['last_read_message_id']
+    }
+
+# Video call group event type -> (client action, fields passed through)
+VIDEO_CALL_EVENTS = {
+    'call_offer': ('offer', ('offer', 'username', 'target')),
+    'call_answer': ('answer', ('answer', 'username', 'target')),
+    'ice_candidate': ('ice-candidate', ('candidate', 'username', 'target')),
+    'ice_candidates': ('ice-candidates', ('candidates', 'username', 'target')),
+    'user_left': ('user_left', ('username',)),
+    'user_joined': ('user_joined', ('username',)),
+}
+
+def video_call_payload(event):
+    action, fields = VIDEO_CALL_EVENTS[event['type']]
+    return {'action': action, **{field: event.get(field) for field in fields}}
+
+class ChatConsumer(EncodedWebsocketMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
@@ -28,7 +70,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_negotiated()
+        await self.join_presence()
 
     async def disconnect(self, close_code):
         # Leave room group
@@ -36,68 +79,119 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        if getattr(self, 'presence_joined', False):
+            await sync_to_async(presence.leave)('room', self.room_id, self.channel_name)
+            presence.presence_broadcaster.schedule(int(self.room_id))
+        # Don't leave this user's last messages waiting on the flush timer
+        if len(message_buffer):
+            await message_buffer.flush()
+        await self.release_rate_limit()
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.within_rate_limit():
+            return
+        text_data_json = self.decode(text_data, bytes_data)
+        action = text_data_json.get('action')
+        if action == 'mark_read':
+            await self.handle_mark_read(text_data_json.get('message_id'))
+            return
+        if action == 'heartbeat':
+            await self.touch_presence()
+            return
+        if action == 'typing':
+            await self.handle_typing(bool(text_data_json.get('typing', True)))
+            return
         message = text_data_json['message']
         # username is no longer trusted from client
         user = self.scope["user"]
         username = user.username
         user_id = user.id
 
-        # Save message to database
-        await self.save_message(message)
-
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'user_id': user_id
-            }
-        )
+        # Queue the message for the next batched insert; only wait for it when
+        # messages must be durable before anyone sees them
+        durable = getattr(settings, 'CHAT_DURABLE_BEFORE_ACK', False)
+        saved = await message_buffer.add(self.room_id, user_id, message, wait=durable)
 
-    async def chat_message(self, event):
-        message = event['message']
-        username = event['username']
-        user_id = event.get('user_id', None)
-        
-        # Prepare response data
-        response_data = {
+        event = {
+            'type': 'chat_message',
             'message': message,
             'username': username,
             'user_id': user_id
         }
-        
-        # Add optional fields if present
-        if 'call_id' in event:
-            response_data['call_id'] = event['call_id']
-        if 'action' in event:
-            response_data['action'] = event['action']
-
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps(response_data))
+        if saved:
+            event['message_id'] = saved.id
+
+        # Send message to room group, encoded once for all members
+        await self.channel_layer.group_send(self.room_group_name, with_frames(event, chat_message_payload))
+
+    async def chat_message(self, event):
+        await self.send_event(event, chat_message_payload)
     
-    @database_sync_to_async
-    def check_participant(self):
+    async def handle_mark_read(self, message_id):
+        user = self.scope["user"]
         try:
-            room = Room.objects.get(id=self.room_id)
-            user = self.scope["user"]
-            if user.user_type == 'admin':
-                return True
-            return room.participants.filter(id=user.id).exists()
-        except Room.DoesNotExist:
-            return False
+            message_id = int(message_id) if message_id else None
+            state = await database_sync_to_async(mark_read)(user.id, int(self.room_id), message_id)
+        except (TypeError, ValueError):
+            # Not an id of a message in this room
+            return
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            with_frames({
+                'type': 'read_receipt',
+                'user_id': user.id,
+                'username': user.username,
+                'last_read_message_id': state.last_read_message_id
+            }, read_receipt_payload)
+        )
+
+    async def read_receipt(self, event):
+        await self.send_event(event, read_receipt_payload)
+
+    async def join_presence(self):
+        await self.touch_presence()
+        self.presence_joined = True
+        # The room broadcast is skipped when the online set didn't change (e.g. a second tab)
+        room_id = int(self.room_id)
+        online = (await sync_to_async(presence.online_users)('room', [room_id]))[room_id]
+        await self.send_payload(presence.presence_payload({'room_id': room_id, 'online': sorted(online)}))
+
+    async def touch_presence(self):
+        await sync_to_async(presence.touch)('room', self.room_id, self.channel_name, self.scope["user"].id)
+        # Also how expired connections in this room get noticed
+        presence.presence_broadcaster.schedule(int(self.room_id))
+
+    async def handle_typing(self, typing):
+        # Ephemeral: forwarded to the room, never stored
+        now = time.monotonic()
+        if typing and now - getattr(self, 'typing_sent_at', 0) < presence.TYPING_REFRESH_SECONDS:
+            return
+        self.typing_sent_at = now if typing else 0
+        user = self.scope["user"]
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            with_frames({
+                'type': 'typing',
+                'user_id': user.id,
+                'username': user.username,
+                'typing': typing
+            }, presence.typing_payload)
+        )
+
+    async def presence_update(self, event):
+        await self.send_event(event, presence.presence_payload)
+
+    async def typing(self, event):
+        await self.send_event(event, presence.typing_payload)
 
     @database_sync_to_async
-    def save_message(self, message):
+    def check_participant(self):
         user = self.scope["user"]
-        room = Room.objects.get(id=self.room_id)
-        Message.objects.create(room=room, sender=user, content=message)
+        if user.user_type == 'admin':
+            return membership.room_members(self.room_id) is not None
+        return membership.is_member(self.room_id, user.id)
 
-class VideoCallConsumer(AsyncWebsocketConsumer):
+class VideoCallConsumer(EncodedWebsocketMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.call_id = self.scope['url_route']['kwargs']['call_id']
         self.call_group_name = f'video_call_{self.call_id}'
@@ -119,15 +213,22 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_negotiated()
+        
+        # username -> channel_name of the other peers, learned from their events
+        self.peer_channels = {}
+        # target username -> ICE candidates waiting for the next batch
+        self.pending_candidates = {}
+        self.candidate_flush = None
         
-        # Notify group about new participant
+        # Notify group about new participant; peers answer it with targeted offers, which tell us their channels
         await self.channel_layer.group_send(
             self.call_group_name,
-            {
+            with_frames({
                 'type': 'user_joined',
-                'username': self.scope["user"].username
-            }
+                'username': self.scope["user"].username,
+                'sender_channel': self.channel_name
+            }, video_call_payload)
         )
 
     async def disconnect(self, close_code):
@@ -136,104 +237,127 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             self.call_group_name,
             self.channel_name
         )
+        if getattr(self, 'pending_candidates', None):
+            await self.flush_candidates()
+        await self.release_rate_limit()
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.within_rate_limit():
+            return
+        text_data_json = self.decode(text_data, bytes_data)
         action = text_data_json['action']
         username = self.scope["user"].username
         
         if action == 'offer':
-            offer = text_data_json['offer']
-            target = text_data_json.get('target')
-            await self.channel_layer.group_send(
-                self.call_group_name,
-                {
-                    'type': 'call_offer',
-                    'offer': offer,
-                    'username': username,
-                    'target': target
-                }
-            )
+            event = {
+                'type': 'call_offer',
+                'offer': text_data_json['offer'],
+                'username': username,
+                'target': text_data_json.get('target')
+            }
         elif action == 'answer':
-            answer = text_data_json['answer']
-            target = text_data_json.get('target')
-            await self.channel_layer.group_send(
-                self.call_group_name,
-                {
-                    'type': 'call_answer',
-                    'answer': answer,
-                    'username': username,
-                    'target': target
-                }
-            )
+            event = {
+                'type': 'call_answer',
+                'answer': text_data_json['answer'],
+                'username': username,
+                'target': text_data_json.get('target')
+            }
         elif action == 'ice-candidate':
-            candidate = text_data_json['candidate']
-            target = text_data_json.get('target')
-            await self.channel_layer.group_send(
-                self.call_group_name,
-                {
-                    'type': 'ice_candidate',
-                    'candidate': candidate,
-                    'username': username,
-                    'target': target
-                }
-            )
+            self.queue_candidates(text_data_json.get('target'), [text_data_json['candidate']])
+            return
+        elif action == 'ice-candidates':
+            self.queue_candidates(text_data_json.get('target'), text_data_json['candidates'])
+            return
         elif action == 'user_left':
-            await self.channel_layer.group_send(
-                self.call_group_name,
-                {
-                    'type': 'user_left',
-                    'username': username
-                }
-            )
+            event = {
+                'type': 'user_left',
+                'username': username
+            }
+        else:
+            return
+        await self.signal(event)
+
+    def queue_candidates(self, target, candidates):
+        """Trickle ICE comes in bursts: collect a target's candidates for VIDEO_ICE_BATCH_MS and send them as one frame"""
+        self.pending_candidates.setdefault(target, []).extend(candidates)
+        if self.candidate_flush is None:
+            loop = asyncio.get_running_loop()
+            delay = getattr(settings, 'VIDEO_ICE_BATCH_MS', 25) / 1000
+            self.candidate_flush = loop.call_later(delay, lambda: loop.create_task(self.flush_candidates()))
+
+    async def flush_candidates(self, target=None):
+        """Send the pending candidates for one target (all targets by default)"""
+        if target is None:
+            if self.candidate_flush:
+                self.candidate_flush.cancel()
+                self.candidate_flush = None
+            batches, self.pending_candidates = self.pending_candidates, {}
+        else:
+            batches = {target: self.pending_candidates.pop(target)} if target in self.pending_candidates else {}
+        username = self.scope["user"].username
+        for batch_target, candidates in batches.items():
+            if len(candidates) == 1:
+                event = {'type': 'ice_candidate', 'candidate': candidates[0], 'username': username, 'target': batch_target}
+            else:
+                event = {'type': 'ice_candidates', 'candidates': candidates, 'username': username, 'target': batch_target}
+            await self.signal(event)
+
+    async def signal(self, event):
+        """Deliver to the target peer's channel when we know it, otherwise to the whole call"""
+        event['sender_channel'] = self.channel_name
+        if event['type'] in ('call_offer', 'call_answer'):
+            # Keep candidates gathered before a new offer/answer ahead of it
+            await self.flush_candidates(event.get('target'))
+        channel = self.peer_channels.get(event.get('target'))
+        if channel:
+            # Encoded by the one receiving consumer, no frames needed
+            await self.channel_layer.send(channel, event)
+        else:
+            await self.channel_layer.group_send(self.call_group_name, with_frames(event, video_call_payload))
+
+    async def relay(self, event):
+        if event.get('sender_channel') == self.channel_name:
+            # Our own group broadcast
+            return
+        if event.get('sender_channel') and event.get('username'):
+            self.peer_channels[event['username']] = event['sender_channel']
+        target = event.get('target')
+        if target and target != self.scope["user"].username:
+            # Group fallback addressed to another peer
+            return
+        await self.send_event(event, video_call_payload)
 
     async def call_offer(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'offer',
-            'offer': event['offer'],
-            'username': event['username'],
-            'target': event.get('target')
-        }))
+        await self.relay(event)
 
     async def call_answer(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'answer',
-            'answer': event['answer'],
-            'username': event['username'],
-            'target': event.get('target')
-        }))
+        await self.relay(event)
 
     async def ice_candidate(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'ice-candidate',
-            'candidate': event['candidate'],
-            'username': event['username'],
-            'target': event.get('target')
-        }))
+        await self.relay(event)
+
+    async def ice_candidates(self, event):
+        await self.relay(event)
 
     async def user_left(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'user_left',
-            'username': event['username']
-        }))
+        self.peer_channels.pop(event['username'], None)
+        if event.get('sender_channel') != self.channel_name:
+            await self.send_event(event, video_call_payload)
 
     async def user_joined(self, event):
-        await self.send(text_data=json.dumps({
-            'action': 'user_joined',
-            'username': event['username']
-        }))
+        await self.relay(event)
 
     @database_sync_to_async
     def check_participant(self):
-        try:
-            call = VideoCall.objects.get(id=self.call_id)
-            user = self.scope["user"]
-            if user.user_type == 'admin':
-                return True
-            # Allow caller
-            if call.caller == user:
-                return True
-            # Check room participants for group calls
-            return call.room.participants.filter(id=user.id).exists()
-        except VideoCall.DoesNotExist:
-            return False
\ No newline at end of file
+        parties = membership.call_parties(self.call_id)
+        if parties is None:
+            return False
+        caller_id, room_id = parties
+        user = self.scope["user"]
+        if user.user_type == 'admin':
+            return True
+        # Allow caller
+        if caller_id == user.id:
+            return True
+        # Check room participants for group calls
+        return membership.is_member(room_id, user.id)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from chat.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = 'Move chat messages from months older than CHAT_ARCHIVE_AFTER_DAYS into compressed per-room archive segments (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override settings.CHAT_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived without moving anything')
+
+    def handle(self, *args, **options):
+        result = archive_messages(older_than_days=options['days'], dry_run=options['dry_run'], log=self.stdout.write)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {result['messages']} messages in {result['segments']} room-months would be archived"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Archived {result['messages']} messages into {result['segments']} room-month segments"))
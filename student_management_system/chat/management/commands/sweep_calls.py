@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from chat.sweeper import sweep_calls
+
+
+class Command(BaseCommand):
+    help = 'Mark unanswered video calls missed and close abandoned ones (run from cron every minute)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Calls updated per UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything')
+
+    def handle(self, *args, **options):
+        result = sweep_calls(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {result['missed']} calls would be marked missed, {result['completed']} completed"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Marked {result['missed']} calls missed and {result['completed']} completed"))
@@ -0,0 +1,130 @@
+"""
+Room membership lookups for authorization.
+
+Who is in a room is asked on every websocket connect and on most chat REST
+calls, and after a deploy every client reconnects at once. Membership is
+kept at two levels:
+- the shared cache ('room_members:<id>', ROOM_MEMBERSHIP_CACHE_SECONDS),
+  deleted by chat.signals whenever Room.participants changes or the room is
+  deleted
+- a copy in process memory, kept ROOM_MEMBERSHIP_LOCAL_SECONDS
+
+A user found in the local copy is let in without any I/O. Anyone else is
+checked again against the shared cache (and the database behind it), so a
+participant who was just added gets in right away; a participant who was
+just removed can still get in through other workers' local copies for up to
+ROOM_MEMBERSHIP_LOCAL_SECONDS.
+
+A video call's caller and room never change, so they are kept in process
+memory only.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from .models import Room, VideoCall
+
+# Entries kept in process memory, per kind
+LOCAL_MAX_ENTRIES = 10000
+
+
+class _LocalCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def set(self, key, value, ttl):
+        if len(self.entries) >= LOCAL_MAX_ENTRIES:
+            now = time.monotonic()
+            self.entries = {k: entry for k, entry in self.entries.items() if entry[1] > now}
+            if len(self.entries) >= LOCAL_MAX_ENTRIES:
+                self.entries.clear()
+        self.entries[key] = (value, time.monotonic() + ttl)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+
+_members = _LocalCache()
+_calls = _LocalCache()
+
+
+def _key(room_id):
+    return f'room_members:{room_id}'
+
+
+def _local_ttl():
+    return getattr(settings, 'ROOM_MEMBERSHIP_LOCAL_SECONDS', 5)
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_members(room_id):
+    """Participant ids of the room from the shared cache or the database; None if there is no such room"""
+    members = cache.get(_key(room_id))
+    if members is None:
+        # One row per participant, or a single None for a room without any
+        rows = list(Room.objects.filter(id=room_id).values_list('participants', flat=True))
+        if not rows:
+            return None
+        members = frozenset(user_id for user_id in rows if user_id is not None)
+        cache.set(_key(room_id), members, getattr(settings, 'ROOM_MEMBERSHIP_CACHE_SECONDS', 300))
+    _members.set(room_id, members, _local_ttl())
+    return members
+
+
+def room_members(room_id):
+    room_id = _as_id(room_id)
+    if room_id is None:
+        return None
+    members = _members.get(room_id)
+    return members if members is not None else load_members(room_id)
+
+
+def is_member(room_id, user_id):
+    room_id = _as_id(room_id)
+    if room_id is None:
+        return False
+    members = _members.get(room_id)
+    if members is not None and user_id in members:
+        return True
+    # Not in the local copy: it may be out of date, ask the shared cache
+    members = load_members(room_id)
+    return members is not None and user_id in members
+
+
+def check_member(room_id, user):
+    """Http404 unless the user is a participant of the room (like get_object_or_404(Room, participants=user))"""
+    if not is_member(room_id, user.id):
+        raise Http404('No Room matches the given query.')
+
+
+def call_parties(call_id):
+    """(caller_id, room_id) of a video call, or None"""
+    call_id = _as_id(call_id)
+    if call_id is None:
+        return None
+    parties = _calls.get(call_id)
+    if parties is None:
+        parties = VideoCall.objects.filter(id=call_id).values_list('caller_id', 'room_id').first()
+        if parties is None:
+            return None
+        _calls.set(call_id, parties, getattr(settings, 'ROOM_MEMBERSHIP_CACHE_SECONDS', 300))
+    return parties
+
+
+def invalidate(room_ids):
+    room_ids = [room_id for room_id in room_ids if room_id is not None]
+    for room_id in room_ids:
+        _members.discard(room_id)
+    cache.delete_many([_key(room_id) for room_id in room_ids])
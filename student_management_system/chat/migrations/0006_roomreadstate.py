@@ -0,0 +1,57 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def backfill_read_states(apps, schema_editor):
+    # Start each participant from the old per-message is_read flags
+    Room = apps.get_model('chat', 'Room')
+    Message = apps.get_model('chat', 'Message')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    latest = dict(Message.objects.order_by().values('room_id').annotate(last=Max('id')).values_list('room_id', 'last'))
+    unread_in_room, unread_by_sender = {}, {}
+    for room_id, sender_id, count in (
+        Message.objects.filter(is_read=False).order_by().values('room_id', 'sender_id')
+        .annotate(count=Count('id')).values_list('room_id', 'sender_id', 'count')
+    ):
+        unread_in_room[room_id] = unread_in_room.get(room_id, 0) + count
+        unread_by_sender[room_id, sender_id] = count
+
+    states = []
+    for room_id, user_id in Room.participants.through.objects.values_list('room_id', 'user_id').iterator():
+        unread = unread_in_room.get(room_id, 0) - unread_by_sender.get((room_id, user_id), 0)
+        states.append(RoomReadState(
+            user_id=user_id, room_id=room_id, unread_count=unread,
+            last_read_message_id=0 if unread else latest.get(room_id, 0),
+        ))
+    RoomReadState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0005_message_chat_messag_room_id_284f10_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'room')},
+            },
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
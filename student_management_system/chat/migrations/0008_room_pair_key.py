@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_pair_keys(apps, schema_editor):
+    # The oldest room for each pair becomes the one that gets reused; duplicates keep working unkeyed
+    Room = apps.get_model('chat', 'Room')
+    Participant = Room.participants.through
+
+    pair_rooms = (
+        Participant.objects.filter(room__room_type__in=('one_on_one', 'support')).order_by()
+        .values('room_id').annotate(count=Count('id')).filter(count=2).values('room_id')
+    )
+    members = {}
+    for room_id, user_id in Participant.objects.filter(room_id__in=pair_rooms).values_list('room_id', 'user_id'):
+        members.setdefault(room_id, []).append(user_id)
+
+    room_types = dict(Room.objects.filter(id__in=members).values_list('id', 'room_type'))
+    keys = {}
+    for room_id in sorted(members):
+        low, high = sorted(members[room_id])
+        keys.setdefault(f'{room_types[room_id]}:{low}:{high}', room_id)
+
+    rooms = [Room(id=room_id, pair_key=key) for key, room_id in keys.items()]
+    Room.objects.bulk_update(rooms, ['pair_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
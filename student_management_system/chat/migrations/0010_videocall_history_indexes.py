@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_messagearchivesegment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['caller', 'created_at'], name='chat_videoc_caller__299edd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['receiver', 'created_at'], name='chat_videoc_receive_328ea3_idx'),
+        ),
+    ]
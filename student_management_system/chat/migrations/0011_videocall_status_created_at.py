@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_videocall_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['status', 'created_at'], name='chat_videoc_status_6c6d80_idx'),
+        ),
+    ]
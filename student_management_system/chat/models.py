@@ -11,6 +11,8 @@ class Room(models.Model):
     name = models.CharField(max_length=100)
     room_type = models.CharField(max_length=20, choices=ROOM_TYPES, default='one_on_one')
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms')
+    # '<room_type>:<user id>:<user id>' for one-on-one and support rooms, see chat.rooms
+    pair_key = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -33,6 +35,43 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of room history
+            models.Index(fields=['room', 'timestamp', 'id']),
+        ]
+
+class MessageArchiveSegment(models.Model):
+    """One room's messages for one calendar month, moved out of Message by chat.archive as compressed JSON"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='archive_segments')
+    month = models.DateField(help_text="First day of the month")
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField(help_text="zlib-compressed JSON list of messages in (timestamp, id) order")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Room {self.room_id} {self.month:%Y-%m}: {self.message_count} messages"
+    
+    class Meta:
+        unique_together = ['room', 'month']
+
+class RoomReadState(models.Model):
+    """Per-user read cursor for a room, with the unread count kept up to date by chat.unread"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='room_read_states')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='read_states')
+    last_read_message_id = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id} in {self.room_id}: {self.unread_count} unread"
+    
+    class Meta:
+        unique_together = ['user', 'room']
 
 class VideoCall(models.Model):
     CALL_STATUS = (
@@ -59,6 +98,13 @@ class VideoCall(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Call history: caller = user OR receiver = user, newest first
+            models.Index(fields=['caller', 'created_at']),
+            models.Index(fields=['receiver', 'created_at']),
+            # Stale call sweeper (chat.sweeper), oldest first per status
+            models.Index(fields=['status', 'created_at']),
+        ]
 
 class CallRecord(models.Model):
     video_call = models.OneToOneField(VideoCall, on_delete=models.CASCADE, related_name='call_record')
@@ -0,0 +1,113 @@
+"""
+Online presence and typing indicators for the websocket consumers.
+
+Presence lives only in the cache (shared between workers through Redis when
+REDIS_URL is set), never in the database. Each key holds one entry per open
+connection, {channel_name: (user_id, expires_at)}:
+- 'presence:room:<id>': chat sockets open on a room
+- 'presence:user:<id>': a user's notification sockets, i.e. the app is open
+Entries expire PRESENCE_TTL seconds after the connection's last heartbeat,
+so a client that disappears without closing drops out on its own. Updates
+are read-modify-write; losing a race only hides a connection until its next
+heartbeat.
+
+Room presence is broadcast as a snapshot of who is online, debounced per
+room: all changes within PRESENCE_BROADCAST_MS go out as one event, and only
+if the set of online users actually changed. Typing events are forwarded to
+the room group as they come and never stored.
+"""
+import asyncio
+import time
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from student_management.websocket import with_frames
+
+# A client that keeps typing re-sends 'typing' at most this often
+TYPING_REFRESH_SECONDS = 3
+
+
+def presence_ttl():
+    return getattr(settings, 'PRESENCE_TTL', 60)
+
+
+def _key(kind, object_id):
+    return f'presence:{kind}:{object_id}'
+
+
+def _live(entries, now):
+    return {channel: entry for channel, entry in (entries or {}).items() if entry[1] > now}
+
+
+def touch(kind, object_id, channel_name, user_id):
+    """Record (or refresh) a connection as online"""
+    now = time.time()
+    key = _key(kind, object_id)
+    entries = _live(cache.get(key), now)
+    entries[channel_name] = (user_id, now + presence_ttl())
+    cache.set(key, entries, presence_ttl())
+
+
+def leave(kind, object_id, channel_name):
+    key = _key(kind, object_id)
+    entries = _live(cache.get(key), time.time())
+    entries.pop(channel_name, None)
+    if entries:
+        cache.set(key, entries, presence_ttl())
+    else:
+        cache.delete(key)
+
+
+def online_users(kind, object_ids):
+    """{object_id: set of online user ids}, in one cache round trip"""
+    now = time.time()
+    found = cache.get_many([_key(kind, object_id) for object_id in object_ids])
+    return {
+        object_id: {user_id for user_id, _ in _live(found.get(_key(kind, object_id)), now).values()}
+        for object_id in object_ids
+    }
+
+
+def presence_payload(event):
+    return {'action': 'presence', 'room_id': event['room_id'], 'online': event['online']}
+
+
+def typing_payload(event):
+    return {
+        'action': 'typing',
+        'user_id': event['user_id'],
+        'username': event['username'],
+        'typing': event['typing']
+    }
+
+
+class PresenceBroadcaster:
+    """Coalesces presence changes into at most one broadcast per room every `delay` seconds"""
+
+    def __init__(self, delay=None):
+        self.delay = delay if delay is not None else getattr(settings, 'PRESENCE_BROADCAST_MS', 1000) / 1000
+        self._scheduled = {}
+
+    def schedule(self, room_id):
+        if room_id in self._scheduled:
+            return
+        loop = asyncio.get_running_loop()
+        self._scheduled[room_id] = loop.call_later(self.delay, lambda: loop.create_task(self.broadcast(room_id)))
+
+    async def broadcast(self, room_id):
+        self._scheduled.pop(room_id, None)
+        online = sorted((await sync_to_async(online_users)('room', [room_id]))[room_id])
+        # The last snapshot sent is kept in the cache so workers don't repeat each other
+        sent_key = _key('room', f'{room_id}:sent')
+        if await sync_to_async(cache.get)(sent_key) == online:
+            return False
+        await sync_to_async(cache.set)(sent_key, online, presence_ttl())
+        await get_channel_layer().group_send(
+            f'chat_{room_id}',
+            with_frames({'type': 'presence_update', 'room_id': room_id, 'online': online}, presence_payload)
+        )
+        return True
+
+
+presence_broadcaster = PresenceBroadcaster()
@@ -0,0 +1,70 @@
+"""
+Room creation helpers.
+
+Participants are resolved with one query and added with one bulk insert into
+the participants through table (which still fires m2m_changed, so read
+states are created by chat.signals).
+
+One-on-one and support rooms between the same two users are reused: such a
+room carries pair_key '<room_type>:<lower user id>:<higher user id>' under a
+unique index, so finding it is a single index lookup and two concurrent
+requests can't both create it.
+"""
+from django.db import IntegrityError, transaction
+from accounts.models import User
+from .models import Room
+
+PAIRED_ROOM_TYPES = ('one_on_one', 'support')
+
+
+def pair_key(room_type, user_id, other_id):
+    low, high = sorted((int(user_id), int(other_id)))
+    return f'{room_type}:{low}:{high}'
+
+
+def existing_user_ids(user_ids):
+    """The subset of user_ids that exist, in one query"""
+    ids = set()
+    for user_id in user_ids:
+        try:
+            ids.add(int(user_id))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return []
+    return list(User.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def open_room(creator, name, room_type, participant_ids=()):
+    """
+    Create a room with the creator and the participants that exist. For a
+    one-on-one or support room with exactly one other user, return their
+    existing room instead. Returns (room, created).
+    """
+    other_ids = [user_id for user_id in existing_user_ids(participant_ids) if user_id != creator.id]
+    if room_type in PAIRED_ROOM_TYPES and len(other_ids) == 1:
+        return get_or_create_pair_room(creator, other_ids[0], room_type, name)
+
+    with transaction.atomic():
+        room = Room.objects.create(name=name, room_type=room_type)
+        room.participants.add(creator.id, *other_ids)
+    return room, True
+
+
+def get_or_create_pair_room(user, other_id, room_type='one_on_one', name=None):
+    key = pair_key(room_type, user.id, other_id)
+    room = Room.objects.filter(pair_key=key).first()
+    if room:
+        if not room.is_active:
+            room.is_active = True
+            room.save(update_fields=['is_active', 'updated_at'])
+        return room, False
+
+    try:
+        with transaction.atomic():
+            room = Room.objects.create(name=name or key, room_type=room_type, pair_key=key)
+            room.participants.add(user.id, other_id)
+    except IntegrityError:
+        # Created by a concurrent request
+        return Room.objects.get(pair_key=key), False
+    return room, True
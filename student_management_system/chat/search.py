@@ -0,0 +1,72 @@
+"""
+Full-text search over chat messages.
+
+The index is kept by the database itself, so every insert path (REST,
+the websocket write buffer, bulk_create) is covered without extra work:
+- PostgreSQL: a GIN index on the SearchVector expression the query is built
+  with (django.contrib.postgres.search)
+- SQLite: an FTS5 external-content table (chat_message_fts) kept in sync
+  by triggers on chat_message, queried with MATCH and snippet()
+(both created by migration 0007). Other backends fall back to an unindexed icontains scan.
+
+Queries are plain words, all of which must match. Results are newest first
+with keyset pagination on the message id, and carry an HTML snippet with the
+matches wrapped in <mark> (everything else escaped); on PostgreSQL they also
+carry their `rank`.
+"""
+import html
+import re
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'chat_message_fts'
+SEARCH_CONFIG = 'simple'
+SNIPPET_WORDS = 12
+# Control characters mark the matches in the raw snippet, so the rest can be escaped
+# (ASCII: SearchHeadline quotes its options as latin-1)
+_START, _STOP = '\x02', '\x03'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    return _WORD.findall(query or '')[:16]
+
+
+def search_messages(queryset, terms):
+    """Filter a Message queryset to those matching every term, annotated with `snippet`"""
+    if connection.vendor == 'postgresql':
+        vector = SearchVector('content', config=SEARCH_CONFIG)
+        query = SearchQuery(' '.join(terms), config=SEARCH_CONFIG, search_type='plain')
+        return queryset.alias(search=vector).filter(search=query).annotate(
+            rank=SearchRank(vector, query),
+            snippet=SearchHeadline(
+                'content', query, config=SEARCH_CONFIG, start_sel=_START, stop_sel=_STOP,
+                max_words=SNIPPET_WORDS * 2, min_words=SNIPPET_WORDS,
+            ),
+        )
+    if connection.vendor == 'sqlite':
+        match = ' '.join('"%s"' % term for term in terms)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]),
+        ).annotate(
+            snippet=RawSQL(
+                f"SELECT snippet({FTS_TABLE}, 0, %s, %s, '...', {SNIPPET_WORDS}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = chat_message.id",
+                [_START, _STOP, match],
+            ),
+        )
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    return queryset
+
+
+def render_snippet(message, terms):
+    snippet = getattr(message, 'snippet', None)
+    if snippet is None:
+        # Unindexed fallback: highlight in Python
+        snippet = message.content
+        for term in terms:
+            snippet = re.sub(f'({re.escape(term)})', f'{_START}\\1{_STOP}', snippet, flags=re.IGNORECASE)
+    return html.escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from .models import Room, Message, VideoCall, CallRecord
+from .search import render_snippet
+from .rooms import open_room, existing_user_ids
+from accounts.models import User
 from accounts.serializers import UserSerializer
 
 class RoomSerializer(serializers.ModelSerializer):
@@ -9,31 +12,70 @@ class RoomSerializer(serializers.ModelSerializer):
         write_only=True, 
         required=False
     )
+    unread_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Room
-        fields = ('id', 'name', 'room_type', 'participants', 'participant_ids', 'is_active', 'created_at')
+        fields = ('id', 'name', 'room_type', 'participants', 'participant_ids', 'is_active', 'created_at', 'unread_count')
         read_only_fields = ('id', 'created_at')
 
     def create(self, validated_data):
         participant_ids = validated_data.pop('participant_ids', [])
-        room = Room.objects.create(**validated_data)
-        
-        # Add participants
         request = self.context.get('request')
-        if request:
-            room.participants.add(request.user)
-        
-        for participant_id in participant_ids:
-            try:
-                from accounts.models import User
-                user = User.objects.get(id=participant_id)
-                room.participants.add(user)
-            except User.DoesNotExist:
-                pass
+        if not request:
+            room = Room.objects.create(**validated_data)
+            room.participants.add(*existing_user_ids(participant_ids))
+            self.created = True
+            return room
         
+        # Reuses an existing one-on-one room with the same user (self.created is then False)
+        room, self.created = open_room(
+            request.user, validated_data['name'], validated_data.get('room_type', 'one_on_one'), participant_ids
+        )
         return room
 
+    def get_unread_count(self, obj):
+        # Annotated by RoomListCreateView; other endpoints don't compute it
+        return getattr(obj, 'unread_count', None) or 0
+
+class InboxRoomSerializer(serializers.ModelSerializer):
+    """Inbox row; expects the annotations and participant prefetch done by RoomInboxView"""
+    last_activity = serializers.DateTimeField(read_only=True)
+    unread_count = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    participant_count = serializers.IntegerField(read_only=True)
+    participants = serializers.SerializerMethodField()
+    
+    PARTICIPANT_PREVIEW = 3
+    
+    class Meta:
+        model = Room
+        fields = ('id', 'name', 'room_type', 'is_active', 'created_at', 'last_activity', 'unread_count',
+                  'last_message', 'participant_count', 'participants')
+    
+    def get_unread_count(self, obj):
+        return obj.unread_count or 0
+    
+    def get_last_message(self, obj):
+        if not obj.last_message_id:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'content': obj.last_message_content,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_at),
+            'sender_id': obj.last_message_sender_id,
+            'sender_username': obj.last_message_sender_username,
+        }
+    
+    def get_participants(self, obj):
+        request = self.context.get('request')
+        others = [user for user in obj.participants.all() if not request or user.id != request.user.id]
+        return [
+            {'id': user.id, 'username': user.username, 'first_name': user.first_name,
+             'last_name': user.last_name, 'user_type': user.user_type}
+            for user in others[:self.PARTICIPANT_PREVIEW]
+        ]
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     
@@ -42,6 +84,24 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ('id', 'room', 'sender', 'content', 'timestamp', 'is_read')
         read_only_fields = ('id', 'room', 'sender', 'timestamp')
 
+class MessageSearchResultSerializer(serializers.ModelSerializer):
+    """A search hit: the message plus an HTML-escaped snippet with the matches in <mark>"""
+    sender = UserSerializer(read_only=True)
+    room_name = serializers.CharField(source='room.name', read_only=True)
+    snippet = serializers.SerializerMethodField()
+    rank = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Message
+        fields = ('id', 'room', 'room_name', 'sender', 'content', 'snippet', 'rank', 'timestamp')
+    
+    def get_snippet(self, obj):
+        return render_snippet(obj, self.context.get('terms', []))
+
+    def get_rank(self, obj):
+        # Only computed on PostgreSQL
+        return getattr(obj, 'rank', None)
+
 class VideoCallSerializer(serializers.ModelSerializer):
     caller = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
@@ -52,10 +112,26 @@ class VideoCallSerializer(serializers.ModelSerializer):
         fields = ('id', 'room', 'caller', 'receiver', 'status', 'start_time', 'end_time', 'duration', 'audio_only', 'created_at')
         read_only_fields = ('id', 'caller', 'created_at')
 
-class CallRecordSerializer(serializers.ModelSerializer):
-    video_call = VideoCallSerializer(read_only=True)
+class CallParticipantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+
+class CallHistorySerializer(serializers.ModelSerializer):
+    """A call without the nested room participants; expects caller, receiver and room to be select_related"""
+    caller = CallParticipantSerializer(read_only=True)
+    receiver = CallParticipantSerializer(read_only=True)
+    room_name = serializers.CharField(source='room.name', read_only=True)
+    room_type = serializers.CharField(source='room.room_type', read_only=True)
+    
+    class Meta:
+        model = VideoCall
+        fields = ('id', 'room', 'room_name', 'room_type', 'caller', 'receiver', 'status', 'start_time', 'end_time',
+                  'duration', 'audio_only', 'created_at')
+
+class CallRecordHistorySerializer(serializers.ModelSerializer):
+    video_call = CallHistorySerializer(read_only=True)
     
     class Meta:
         model = CallRecord
-        fields = ('id', 'video_call', 'recording_url', 'transcript', 'created_at')
-        read_only_fields = ('id', 'created_at')
\ No newline at end of file
+        fields = ('id', 'video_call', 'recording_url', 'transcript', 'created_at')
\ No newline at end of file
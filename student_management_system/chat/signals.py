@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+from .models import Room, Message, RoomReadState
+from . import membership
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def sync_read_states(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep one read cursor per participant; new participants start with the existing history read"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        # pk_set isn't provided for clear()
+        field = 'user_id' if reverse else 'room_id'
+        RoomReadState.objects.filter(**{field: instance.pk}).delete()
+        return
+
+    # reverse means user.chat_rooms.add(...): instance is the user and pk_set holds rooms
+    if reverse:
+        pairs = [(instance.pk, room_id) for room_id in pk_set]
+    else:
+        pairs = [(user_id, instance.pk) for user_id in pk_set]
+
+    if action == 'post_remove':
+        if reverse:
+            RoomReadState.objects.filter(user_id=instance.pk, room_id__in=pk_set).delete()
+        else:
+            RoomReadState.objects.filter(room_id=instance.pk, user_id__in=pk_set).delete()
+        return
+
+    latest = dict(
+        Message.objects.filter(room_id__in={room_id for _, room_id in pairs}).order_by()
+        .values('room_id').annotate(last=Max('id')).values_list('room_id', 'last')
+    )
+    RoomReadState.objects.bulk_create([
+        RoomReadState(user_id=user_id, room_id=room_id, last_read_message_id=latest.get(room_id, 0))
+        for user_id, room_id in pairs
+    ], ignore_conflicts=True)
+
+
+def _forget_members(room_ids):
+    # Again on commit, in case another request cached the old participants before the transaction committed
+    membership.invalidate(room_ids)
+    transaction.on_commit(lambda: membership.invalidate(room_ids))
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached participants of every room whose participants changed"""
+    if reverse and action == 'pre_clear':
+        # user.chat_rooms.clear(): which rooms is only known beforehand
+        instance._cleared_room_ids = list(instance.chat_rooms.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _forget_members([instance.pk])
+    elif action == 'post_clear':
+        _forget_members(getattr(instance, '_cleared_room_ids', []))
+    else:
+        _forget_members(list(pk_set))
+
+
+@receiver(post_delete, sender=Room)
+def forget_deleted_room(sender, instance, **kwargs):
+    _forget_members([instance.pk])
@@ -0,0 +1,99 @@
+"""
+Resolve video calls that nobody closed.
+
+- pending calls nobody answered within CALL_RING_TIMEOUT_SECONDS become 'missed'
+- ongoing calls older than CALL_MAX_DURATION_SECONDS (the client crashed or
+  never called end_video_call) become 'completed', ending at
+  start_time + CALL_MAX_DURATION_SECONDS at the latest
+
+Both scans walk the (status, created_at) index oldest deadline first, a
+batch at a time, with one UPDATE per batch. The rooms are told with one
+batch of group sends per run.
+"""
+import asyncio
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, IntegerField, Q, Value, When
+from django.utils import timezone
+from student_management.websocket import with_frames
+from .consumers import chat_message_payload
+from .models import VideoCall
+
+
+def _locked_batch(status, deadline, after, batch_size):
+    queryset = VideoCall.objects.select_for_update(skip_locked=True).filter(status=status, created_at__lt=deadline)
+    if after:
+        queryset = queryset.filter(Q(created_at__gt=after[0]) | Q(created_at=after[0], id__gt=after[1]))
+    return list(queryset.order_by('created_at', 'id').values('id', 'room_id', 'created_at', 'start_time')[:batch_size])
+
+
+def _sweep(status, deadline, resolve, batch_size, dry_run):
+    """Walk calls in `status` created before the deadline; resolve(rows, dry_run) updates a batch and returns the resolved rows"""
+    resolved, after = [], None
+    while True:
+        with transaction.atomic():
+            rows = _locked_batch(status, deadline, after, batch_size)
+            if not rows:
+                break
+            after = rows[-1]['created_at'], rows[-1]['id']
+            resolved.extend(resolve(rows, dry_run))
+    return resolved
+
+
+def sweep_calls(now=None, ring_timeout=None, max_duration=None, batch_size=500, dry_run=False, notify=True):
+    now = now or timezone.now()
+    ring_timeout = timedelta(seconds=ring_timeout or getattr(settings, 'CALL_RING_TIMEOUT_SECONDS', 60))
+    max_duration = timedelta(seconds=max_duration or getattr(settings, 'CALL_MAX_DURATION_SECONDS', 4 * 3600))
+
+    def miss(rows, dry_run):
+        if dry_run:
+            return rows
+        VideoCall.objects.filter(id__in=[row['id'] for row in rows], status='pending').update(status='missed', end_time=now)
+        return rows
+
+    def complete(rows, dry_run):
+        # created_at <= start_time, so the index range is a superset; keep the calls that started before the cutoff
+        rows = [row for row in rows if (row['start_time'] or row['created_at']) < now - max_duration]
+        if not rows or dry_run:
+            return rows
+        ends = {row['id']: min(now, (row['start_time'] or row['created_at']) + max_duration) for row in rows}
+        durations = {row['id']: int((ends[row['id']] - (row['start_time'] or row['created_at'])).total_seconds()) for row in rows}
+        VideoCall.objects.filter(id__in=ends, status='ongoing').update(
+            status='completed',
+            end_time=Case(*[When(id=call_id, then=Value(end)) for call_id, end in ends.items()], output_field=DateTimeField()),
+            duration=Case(*[When(id=call_id, then=Value(seconds)) for call_id, seconds in durations.items()], output_field=IntegerField()),
+        )
+        return rows
+
+    missed = _sweep('pending', now - ring_timeout, miss, batch_size, dry_run)
+    completed = _sweep('ongoing', now - max_duration, complete, batch_size, dry_run)
+
+    if notify and not dry_run and (missed or completed):
+        notify_rooms([(row, 'call_missed', 'Missed video call') for row in missed] +
+                     [(row, 'call_ended', 'Video call ended') for row in completed])
+    return {'missed': len(missed), 'completed': len(completed)}
+
+
+def notify_rooms(changes):
+    """Send every room its call status changes in one trip to the channel layer"""
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return
+
+    async def send_all():
+        await asyncio.gather(*[
+            channel_layer.group_send(f"chat_{row['room_id']}", with_frames({
+                'type': 'chat_message',
+                'message': message,
+                'username': 'System',
+                'user_id': None,
+                'call_id': row['id'],
+                'action': action,
+            }, chat_message_payload))
+            for row, action, message in changes
+        ])
+
+    async_to_sync(send_all)()
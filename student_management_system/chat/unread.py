@@ -0,0 +1,82 @@
+"""
+Unread message counters.
+
+Every room participant has a RoomReadState row (created by chat.signals when
+they join). New messages bump unread_count for everyone in the room but the
+sender, and marking a room read moves the cursor and recomputes the count, so
+unread badges never have to count messages.
+
+Both sides only ever count messages after the cursor: the bump skips readers
+whose cursor is already at or past a message (they read it between its insert
+and the bump), and marking read recounts from Message. The cursor only moves
+to messages of the room itself.
+"""
+from collections import defaultdict
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from .models import Message, RoomReadState
+from .archive import find_archived
+
+
+def record_new_messages(messages):
+    """Bump unread counts for saved messages (one UPDATE per room and sender), by the messages past each reader's cursor"""
+    groups = defaultdict(list)
+    for message in messages:
+        groups[(message.room_id, message.sender_id)].append(message.id)
+    for (room_id, sender_id), message_ids in groups.items():
+        message_ids.sort()
+        # A cursor below the i-th message leaves it and every later one unread
+        unread = Case(
+            *[When(last_read_message_id__lt=message_id, then=Value(len(message_ids) - i)) for i, message_id in enumerate(message_ids)],
+            default=Value(0),
+        )
+        RoomReadState.objects.filter(room_id=room_id, last_read_message_id__lt=message_ids[-1]).exclude(user_id=sender_id).update(
+            unread_count=F('unread_count') + unread
+        )
+
+
+def _unread_after(room_id, user_id, message_id):
+    return Coalesce(Subquery(
+        Message.objects.filter(room_id=room_id, id__gt=message_id).exclude(sender_id=user_id)
+        .order_by().values('room_id').annotate(count=Count('id')).values('count')[:1]
+    ), Value(0))
+
+
+def mark_read(user_id, room_id, message_id=None):
+    """
+    Move the user's cursor up to message_id (the latest message by default) and
+    recount their unread messages. The cursor never moves back, except off ids
+    past the room's latest message. ValueError if message_id isn't in the room.
+    """
+    latest = Message.objects.filter(room_id=room_id).aggregate(latest=Max('id'))['latest'] or 0
+    if message_id is None:
+        message_id = latest
+    elif not Message.objects.filter(id=message_id, room_id=room_id).exists() and not find_archived(room_id, message_id):
+        raise ValueError('message_id is not a message in this room')
+    state, _ = RoomReadState.objects.get_or_create(user_id=user_id, room_id=room_id)
+    cursor = max(min(state.last_read_message_id, latest), message_id)
+    # A concurrent mark_read further ahead wins
+    RoomReadState.objects.filter(Q(last_read_message_id__lte=cursor) | Q(last_read_message_id__gt=latest), pk=state.pk).update(
+        last_read_message_id=cursor, unread_count=_unread_after(room_id, user_id, cursor)
+    )
+    state.refresh_from_db(fields=['last_read_message_id', 'unread_count'])
+    return state
+
+
+def mark_all_read(user_id, room_ids=None):
+    """Mark every (or the given) room read up to its latest message in a single UPDATE; cursors never move back"""
+    states = RoomReadState.objects.filter(user_id=user_id)
+    if room_ids is not None:
+        states = states.filter(room_id__in=room_ids)
+    latest = Message.objects.filter(room_id=OuterRef('room_id')).order_by().values('room_id').annotate(latest=Max('id')).values('latest')
+    return states.update(
+        last_read_message_id=Greatest(Coalesce(Subquery(latest), F('last_read_message_id')), F('last_read_message_id')),
+        unread_count=0,
+    )
+
+
+def unread_counts(user_id):
+    """{room_id: unread} for rooms with unread messages"""
+    return dict(
+        RoomReadState.objects.filter(user_id=user_id, unread_count__gt=0).values_list('room_id', 'unread_count')
+    )
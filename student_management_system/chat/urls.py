@@ -5,11 +5,18 @@ urlpatterns = [
     # Room URLs
     path('rooms/', views.RoomListCreateView.as_view(), name='room-list-create'),
     path('rooms/<int:pk>/', views.RoomDetailView.as_view(), name='room-detail'),
+    path('inbox/', views.RoomInboxView.as_view(), name='room-inbox'),
     path('rooms/create/', views.create_room, name='create-room'),
     path('rooms/support/', views.create_support_chat, name='create-support-chat'),
+    path('rooms/read/', views.mark_rooms_read, name='mark-rooms-read'),
+    path('rooms/<int:room_id>/read/', views.mark_room_read, name='mark-room-read'),
+    path('unread/', views.unread_summary, name='unread-summary'),
+    path('rooms/<int:room_id>/presence/', views.room_presence, name='room-presence'),
+    path('presence/', views.user_presence, name='user-presence'),
     
     # Message URLs
     path('rooms/<int:room_id>/messages/', views.MessageListCreateView.as_view(), name='message-list-create'),
+    path('messages/search/', views.message_search, name='message-search'),
     # path('rooms/<int:room_id>/messages/create/', views.MessageCreateView.as_view(), name='message-create'), # Deprecated
     
     # Video Call URLs
@@ -17,6 +24,7 @@ urlpatterns = [
     path('video-calls/<int:call_id>/accept/', views.accept_video_call, name='accept-video-call'),
     path('video-calls/<int:call_id>/end/', views.end_video_call, name='end-video-call'),
     path('video-calls/history/', views.VideoCallHistoryView.as_view(), name='video-call-history'),
+    path('video-calls/analytics/', views.call_analytics_view, name='video-call-analytics'),
     
     # Call Record URLs
     path('call-records/', views.CallRecordListView.as_view(), name='call-record-list'),
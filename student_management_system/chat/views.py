@@ -3,9 +3,24 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Room, Message, VideoCall, CallRecord
+from django.db.models import Count, Prefetch, Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework.pagination import PageNumberPagination
+from .models import Room, Message, VideoCall, CallRecord, RoomReadState
+from .unread import record_new_messages, mark_read, mark_all_read, unread_counts
+from .presence import online_users
+from .search import search_terms, search_messages
+from .rooms import open_room, get_or_create_pair_room
+from .archive import find_archived, archived_before, archived_after
+from .analytics import call_analytics
+from .membership import check_member, room_members, is_member
 from accounts.models import User
-from .serializers import RoomSerializer, MessageSerializer, VideoCallSerializer, CallRecordSerializer
+from .serializers import (
+    RoomSerializer, InboxRoomSerializer, MessageSerializer, MessageSearchResultSerializer, VideoCallSerializer,
+    CallHistorySerializer, CallRecordHistorySerializer,
+)
+from .consumers import chat_message_payload, read_receipt_payload, video_call_payload
+from student_management.websocket import with_frames
 import uuid
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -15,12 +30,64 @@ class RoomListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Room.objects.filter(participants=self.request.user, is_active=True)
+        unread = RoomReadState.objects.filter(room=OuterRef('pk'), user=self.request.user).values('unread_count')[:1]
+        return Room.objects.filter(participants=self.request.user, is_active=True).annotate(unread_count=Subquery(unread))
     
+    def create(self, request, *args, **kwargs):
+        # 200 rather than 201 when an existing one-on-one room is reused, like create_room
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        if not serializer.created:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
     def perform_create(self, serializer):
-        room = serializer.save()
-        # Add creator as participant
-        room.participants.add(self.request.user)
+        # RoomSerializer.create adds the creator as a participant
+        serializer.save()
+
+class InboxPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class RoomInboxView(generics.ListAPIView):
+    """
+    The user's rooms ordered by last activity, each with its latest message,
+    unread count and a participant preview. Three queries per page: count,
+    rooms with correlated subqueries, participants prefetch.
+    """
+    serializer_class = InboxRoomSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InboxPagination
+    
+    def get_queryset(self):
+        user = self.request.user
+        latest = Message.objects.filter(room=OuterRef('pk')).order_by('-timestamp', '-id')
+        unread = RoomReadState.objects.filter(room=OuterRef('pk'), user=user).values('unread_count')[:1]
+        participant_count = (
+            Room.participants.through.objects.filter(room_id=OuterRef('pk')).order_by()
+            .values('room_id').annotate(count=Count('id')).values('count')[:1]
+        )
+        return (
+            Room.objects.filter(participants=user, is_active=True)
+            .annotate(
+                last_message_id=Subquery(latest.values('id')[:1]),
+                last_message_content=Subquery(latest.values('content')[:1]),
+                last_message_at=Subquery(latest.values('timestamp')[:1]),
+                last_message_sender_id=Subquery(latest.values('sender_id')[:1]),
+                last_message_sender_username=Subquery(latest.values('sender__username')[:1]),
+                unread_count=Subquery(unread),
+                participant_count=Subquery(participant_count),
+            )
+            .annotate(last_activity=Coalesce('last_message_at', 'created_at'))
+            .prefetch_related(Prefetch(
+                'participants',
+                queryset=User.objects.only('id', 'username', 'first_name', 'last_name', 'user_type').order_by('id'),
+            ))
+            .order_by('-last_activity', '-id')
+        )
 
 class RoomDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = RoomSerializer
@@ -30,30 +97,219 @@ class RoomDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Room.objects.filter(participants=self.request.user, is_active=True)
 
 class MessageListCreateView(generics.ListCreateAPIView):
+    """
+    Room history, a page at a time: the latest messages by default,
+    ?before=<message id> for older ones and ?after=<message id> for newer ones.
+    Each page is in chronological order. Paging runs on from the hot table into
+    the archived segments (chat.archive) and back.
+    """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    page_size = 50
+    max_page_size = 200
     
     def get_queryset(self):
         room_id = self.kwargs['room_id']
-        room = get_object_or_404(Room, id=room_id, participants=self.request.user)
-        return Message.objects.filter(room=room).select_related('sender')
+        check_member(room_id, self.request.user)
+        return Message.objects.filter(room_id=room_id).select_related('sender')
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', self.page_size)), self.max_page_size))
+            before = request.query_params.get('before')
+            after = request.query_params.get('after')
+            before, after = int(before) if before else None, int(after) if after else None
+        except ValueError:
+            return Response({'error': 'limit, before and after must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if before and after:
+            return Response({'error': 'Pass either before or after, not both'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Keyset over the (room, timestamp, id) index; the cursor message's timestamp is looked up in the same query
+        cursor_id = before or after
+        if cursor_id:
+            cursor_time = Subquery(Message.objects.filter(room_id=self.kwargs['room_id'], id=cursor_id).values('timestamp')[:1])
+        if after:
+            queryset = queryset.filter(Q(timestamp__gt=cursor_time) | Q(timestamp=cursor_time, id__gt=after)).order_by('timestamp', 'id')
+        else:
+            if before:
+                queryset = queryset.filter(Q(timestamp__lt=cursor_time) | Q(timestamp=cursor_time, id__lt=before))
+            queryset = queryset.order_by('-timestamp', '-id')
+        
+        messages = list(queryset[:limit + 1])
+        room_id = int(self.kwargs['room_id'])
+        if after:
+            # Nothing newer than a hot cursor is the usual poll; only an archived cursor continues in the archive
+            if not messages and not Message.objects.filter(room_id=room_id, id=after).exists():
+                # Continue through the archive and on into the hot table
+                key = find_archived(room_id, after)
+                if key:
+                    messages = archived_after(room_id, key, limit + 1)
+                    if len(messages) <= limit:
+                        messages += list(self.get_queryset().order_by('timestamp', 'id')[:limit + 1 - len(messages)])
+        elif len(messages) <= limit:
+            # Out of hot history: carry on into the archived segments
+            key = self.archive_key(room_id, messages, before)
+            if key is not False:
+                messages += archived_before(room_id, key, limit + 1 - len(messages))
+        
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if not after:
+            messages.reverse()
+        
+        return Response({
+            'results': self.get_serializer(messages, many=True).data,
+            'has_more': has_more,
+            'before': messages[0].id if messages else before,
+            'after': messages[-1].id if messages else after,
+        })
+    
+    def archive_key(self, room_id, messages, before):
+        """Where older history continues in the archive: (timestamp, id), None for the newest archived, False for nowhere"""
+        if messages:
+            return messages[-1].timestamp, messages[-1].id
+        if not before:
+            return None
+        timestamp = Message.objects.filter(id=before, room_id=room_id).values_list('timestamp', flat=True).first()
+        if timestamp:
+            return timestamp, before
+        return find_archived(room_id, before) or False
     
     def perform_create(self, serializer):
-        room_id = self.kwargs['room_id']
-        room = get_object_or_404(Room, id=room_id, participants=self.request.user)
-        message = serializer.save(room=room, sender=self.request.user)
+        room_id = int(self.kwargs['room_id'])
+        check_member(room_id, self.request.user)
+        message = serializer.save(room_id=room_id, sender=self.request.user)
+        record_new_messages([message])
         
         # Broadcast message to room group
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
-            f'chat_{room.id}',
-            {
+            f'chat_{room_id}',
+            with_frames({
                 'type': 'chat_message',
                 'message': message.content,
                 'username': self.request.user.username
-            }
+            }, chat_message_payload)
         )
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def message_search(request):
+    """
+    Full-text search over messages in the requester's rooms (optionally one ?room_id=),
+    newest first; pass the returned `before` to get the next page.
+    """
+    terms = search_terms(request.query_params.get('q'))
+    if not terms:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        before = request.query_params.get('before')
+        room_id = request.query_params.get('room_id')
+        before, room_id = int(before) if before else None, int(room_id) if room_id else None
+    except ValueError:
+        return Response({'error': 'limit, before and room_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rooms = Room.participants.through.objects.filter(user_id=request.user.id)
+    if room_id:
+        rooms = rooms.filter(room_id=room_id)
+    queryset = Message.objects.filter(room_id__in=rooms.values('room_id'))
+    if before:
+        queryset = queryset.filter(id__lt=before)
+    queryset = search_messages(queryset, terms).select_related('sender', 'room').order_by('-id')
+    
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return Response({
+        'results': MessageSearchResultSerializer(messages, many=True, context={'terms': terms}).data,
+        'has_more': has_more,
+        'before': messages[-1].id if messages else before,
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mark_room_read(request, room_id):
+    """Mark a room read up to message_id (default: its latest message) and tell the other participants"""
+    room = get_object_or_404(Room, id=room_id, participants=request.user)
+    message_id = request.data.get('message_id')
+    try:
+        message_id = int(message_id) if message_id is not None else None
+    except (TypeError, ValueError):
+        return Response({'error': 'message_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        state = mark_read(request.user.id, room.id, message_id)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f'chat_{room.id}',
+        with_frames({
+            'type': 'read_receipt',
+            'user_id': request.user.id,
+            'username': request.user.username,
+            'last_read_message_id': state.last_read_message_id
+        }, read_receipt_payload)
+    )
+    
+    return Response({
+        'room_id': room.id,
+        'last_read_message_id': state.last_read_message_id,
+        'unread_count': state.unread_count
+    })
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mark_rooms_read(request):
+    """Mark several rooms (all of them when room_ids is omitted) read in one go"""
+    room_ids = request.data.get('room_ids')
+    if room_ids is not None and not isinstance(room_ids, list):
+        return Response({'error': 'room_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # Through str() so that floats, booleans and nested values are rejected too
+        room_ids = [int(str(room_id)) for room_id in room_ids] if room_ids is not None else None
+    except ValueError:
+        return Response({'error': 'room_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    updated = mark_all_read(request.user.id, room_ids)
+    return Response({'updated': updated})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def unread_summary(request):
+    """Unread message counts per room for badges"""
+    rooms = unread_counts(request.user.id)
+    return Response({
+        'total': sum(rooms.values()),
+        'rooms': rooms
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def room_presence(request, room_id):
+    """Users with the room open right now (read from the presence cache)"""
+    check_member(room_id, request.user)
+    return Response({
+        'room_id': room_id,
+        'online': sorted(online_users('room', [room_id])[room_id])
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def user_presence(request):
+    """Which of ?user_ids=1,2,3 currently have the app open"""
+    try:
+        user_ids = [int(user_id) for user_id in request.query_params.get('user_ids', '').split(',') if user_id]
+    except ValueError:
+        return Response({'error': 'user_ids must be a comma separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(user_ids) > 200:
+        return Response({'error': 'At most 200 user_ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+    online = online_users('user', user_ids)
+    return Response({'online': [user_id for user_id in user_ids if online[user_id]]})
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_room(request):
@@ -67,43 +323,32 @@ def create_room(request):
             'error': 'Room name is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create room
-    room = Room.objects.create(
-        name=room_name,
-        room_type=room_type
-    )
-    
-    # Add participants
-    room.participants.add(request.user)
-    for participant_id in participant_ids:
-        try:
-            user = User.objects.get(id=participant_id)
-            room.participants.add(user)
-        except User.DoesNotExist:
-            pass
+    # A one-on-one room with someone we already have a room with returns that room
+    room, created = open_room(request.user, room_name, room_type, participant_ids)
     
     serializer = RoomSerializer(room)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def start_video_call(request, room_id):
     """Start a video call"""
-    room = get_object_or_404(Room, id=room_id, participants=request.user)
+    check_member(room_id, request.user)
+    room = get_object_or_404(Room, id=room_id)
     audio_only = request.data.get('audio_only', False)
     
     # Create video call
     # If group call, receiver will be null
-    receiver = None
+    receiver_id = None
     if room.room_type == 'one_on_one':
-        other_participants = room.participants.exclude(id=request.user.id)
-        if other_participants.exists():
-            receiver = other_participants.first()
+        other_participants = room_members(room.id) - {request.user.id}
+        if other_participants:
+            receiver_id = min(other_participants)
     
     call = VideoCall.objects.create(
         room=room,
         caller=request.user,
-        receiver=receiver,
+        receiver_id=receiver_id,
         status='pending',
         audio_only=audio_only
     )
@@ -112,7 +357,7 @@ def start_video_call(request, room_id):
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.group_send)(
         f'chat_{room.id}',
-        {
+        with_frames({
             'type': 'chat_message',
             'message': f"Video call started by {request.user.username}",
             'username': 'System',
@@ -120,7 +365,7 @@ def start_video_call(request, room_id):
             'call_id': call.id,
             'action': 'incoming_call',
             'audio_only': audio_only
-        }
+        }, chat_message_payload)
     )
     
     serializer = VideoCallSerializer(call)
@@ -130,7 +375,7 @@ def start_video_call(request, room_id):
 @permission_classes([permissions.IsAuthenticated])
 def accept_video_call(request, call_id):
     """Accept a video call"""
-    call = get_object_or_404(VideoCall, id=call_id, status='pending')
+    call = get_object_or_404(VideoCall.objects.select_related('room'), id=call_id, status='pending')
     
     # Check if user is allowed to accept
     if call.room.room_type == 'one_on_one':
@@ -138,7 +383,7 @@ def accept_video_call(request, call_id):
             return Response({'error': 'You are not the intended receiver of this call'}, status=status.HTTP_403_FORBIDDEN)
     else:
         # Group or support chat: any participant except the caller can accept
-        if not call.room.participants.filter(id=request.user.id).exists():
+        if not is_member(call.room_id, request.user.id):
             return Response({'error': 'You are not a participant of this chat'}, status=status.HTTP_403_FORBIDDEN)
         if call.caller == request.user:
             return Response({'error': 'Caller cannot accept their own call'}, status=status.HTTP_403_FORBIDDEN)
@@ -154,7 +399,7 @@ def accept_video_call(request, call_id):
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.group_send)(
         f'chat_{call.room.id}',
-        {
+        with_frames({
             'type': 'chat_message',
             'message': f"Call accepted by {request.user.username}",
             'username': 'System',
@@ -162,16 +407,16 @@ def accept_video_call(request, call_id):
             'call_id': call.id,
             'action': 'call_accepted',
             'accepted_by': request.user.username
-        }
+        }, chat_message_payload)
     )
     
     # Also notify the video call group directly for participants already in the call UI
     async_to_sync(channel_layer.group_send)(
         f'video_call_{call.id}',
-        {
+        with_frames({
             'type': 'user_joined',
             'username': request.user.username
-        }
+        }, video_call_payload)
     )
     
     serializer = VideoCallSerializer(call)
@@ -226,36 +471,46 @@ def create_support_chat(request):
     support_user = available_users.first()
     room_name = f"support_{request.user.id}_{support_user.id}_{uuid.uuid4().hex[:8]}"
     
-    # Create room
-    room = Room.objects.create(
-        name=room_name,
-        room_type='support'
-    )
-    
-    # Add participants
-    room.participants.add(request.user, support_user)
+    # Reuse the support room with this user if there is one
+    room, created = get_or_create_pair_room(request.user, support_user.id, 'support', room_name)
     
     serializer = RoomSerializer(room)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 class VideoCallHistoryView(generics.ListAPIView):
-    serializer_class = VideoCallSerializer
+    """Calls the user made or received, in one query (the OR is served by the caller and receiver indexes)"""
+    serializer_class = CallHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return VideoCall.objects.filter(
-            caller=self.request.user
-        ).union(
-            VideoCall.objects.filter(receiver=self.request.user)
-        ).order_by('-created_at')
+        user = self.request.user
+        return (
+            VideoCall.objects.filter(Q(caller=user) | Q(receiver=user))
+            .select_related('caller', 'receiver', 'room')
+            .order_by('-created_at')
+        )
 
 class CallRecordListView(generics.ListAPIView):
-    serializer_class = CallRecordSerializer
+    serializer_class = CallRecordHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return CallRecord.objects.filter(
-            video_call__caller=self.request.user
-        ).union(
-            CallRecord.objects.filter(video_call__receiver=self.request.user)
-        ).order_by('-created_at')
\ No newline at end of file
+        user = self.request.user
+        return (
+            CallRecord.objects.filter(Q(video_call__caller=user) | Q(video_call__receiver=user))
+            .select_related('video_call__caller', 'video_call__receiver', 'video_call__room')
+            .order_by('-created_at')
+        )
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def call_analytics_view(request):
+    """Call minutes and missed-call rates per user per month (admins: everyone, or ?user_id=)"""
+    try:
+        months = min(max(int(request.query_params.get('months', 12)), 1), 36)
+        user_id = int(request.query_params['user_id']) if request.query_params.get('user_id') else None
+    except ValueError:
+        return Response({'error': 'months and user_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not (request.user.is_staff or request.user.user_type == 'admin'):
+        user_id = request.user.id
+    return Response({'months': months, 'results': call_analytics(months, user_id)})
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Earnings over time, aggregated in the database.
+
+Buckets that have closed (yesterday, last week, last month...) rarely change,
+so they are cached for EARNINGS_TIMESERIES_CACHE_SECONDS and only the
+currently open bucket is queried on each request. When a bucket closes, only
+that bucket is aggregated and appended to the cached rows. Cancelling an old
+earning bumps the cache version; the expiry bounds how long other workers can
+serve stale rows when the cache isn't shared (LocMemCache).
+
+A start/end range is applied in the query and bypasses the cache.
+"""
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Earning
+
+TRUNC = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def _version_key(tutor_id):
+    return f'earnings_ts_version:{tutor_id or "all"}'
+
+
+def invalidate(tutor_id):
+    """Drop cached closed buckets for a tutor and for the all-tutors view"""
+    for key in (_version_key(tutor_id), _version_key(None)):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+
+
+def open_bucket_start(interval, now=None):
+    now = timezone.localtime(now or timezone.now())
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        start -= timedelta(days=start.weekday())
+    elif interval == 'month':
+        start = start.replace(day=1)
+    return start
+
+
+def _bucket_date(interval, day, following=False):
+    """First day of the bucket holding `day`, or of the bucket after it"""
+    if interval == 'week':
+        day -= timedelta(days=day.weekday())
+    elif interval == 'month':
+        day = day.replace(day=1)
+    if not following:
+        return day
+    if interval == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=7 if interval == 'week' else 1)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def _aggregate(queryset, interval):
+    rows = (
+        queryset.exclude(status='cancelled')
+        .annotate(bucket=TRUNC[interval]('created_at'))
+        .order_by()
+        .values('bucket', 'source_type')
+        .annotate(gross=Sum('amount'), commission=Sum('admin_commission'), net=Sum('net_earning'), count=Count('id'))
+        .order_by('bucket', 'source_type')
+    )
+    return list(rows)
+
+
+def earnings_timeseries(interval, tutor_id=None, source_type=None, start=None, end=None):
+    """
+    Rows of {bucket, source_type, gross, commission, net, count} ordered by bucket,
+    limited to buckets starting within [start, end] (dates) when given
+    """
+    queryset = Earning.objects.all()
+    if tutor_id:
+        queryset = queryset.filter(tutor_id=tutor_id)
+    if source_type:
+        queryset = queryset.filter(source_type=source_type)
+    if start or end:
+        if start:
+            first = _bucket_date(interval, start)
+            if first < start:
+                first = _bucket_date(interval, start, following=True)
+            queryset = queryset.filter(created_at__gte=_midnight(first))
+        if end:
+            queryset = queryset.filter(created_at__lt=_midnight(_bucket_date(interval, end, following=True)))
+        return _aggregate(queryset, interval)
+
+    open_start = open_bucket_start(interval)
+    version = cache.get_or_set(_version_key(tutor_id), 1, None)
+    key = f'earnings_ts:{version}:{tutor_id or "all"}:{interval}:{source_type or "all"}'
+
+    cached = cache.get(key)
+    if cached and cached['open_start'] == open_start:
+        closed = cached['rows']
+    elif cached and cached['open_start'] < open_start:
+        # Buckets closed since the last call: add just those
+        closed = cached['rows'] + _aggregate(
+            queryset.filter(created_at__gte=cached['open_start'], created_at__lt=open_start), interval
+        )
+        cache.set(key, {'open_start': open_start, 'rows': closed}, settings.EARNINGS_TIMESERIES_CACHE_SECONDS)
+    else:
+        closed = _aggregate(queryset.filter(created_at__lt=open_start), interval)
+        cache.set(key, {'open_start': open_start, 'rows': closed}, settings.EARNINGS_TIMESERIES_CACHE_SECONDS)
+
+    return closed + _aggregate(queryset.filter(created_at__gte=open_start), interval)
@@ -0,0 +1,126 @@
+"""
+Promotes pending earnings to available once their hold period is over.
+
+Earnings are held for settings.EARNING_HOLD_DAYS, and for course earnings
+also until the enrollment's money back guarantee has expired. Earnings whose
+guarantee has been refunded will never clear, so each run cancels them first.
+Runs walk the (status, created_at) index from a
+persisted high-water mark, so each run only reads earnings that became old
+enough since the previous one. Earnings skipped because of a guarantee are
+picked up again by a second pass over guarantees that expired since the last run.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from payments.models import MoneyBackGuarantee
+from . import analytics, ledger
+from .models import Earning, JobCheckpoint
+
+CHECKPOINT_NAME = 'earning_clearance'
+
+
+def _guarantee_hold(now):
+    return Exists(MoneyBackGuarantee.objects.filter(enrollment_id=OuterRef('course_enrollment_id')).filter(
+        Q(refund_processed=True) | Q(is_eligible=True, guarantee_expiry_date__gt=now)
+    ))
+
+
+def _move(rows, status, dry_run):
+    """rows are (id, tutor_id, net_earning) of locked pending earnings, moved to status"""
+    if not rows:
+        return 0
+    if dry_run:
+        return len(rows)
+    moved = Earning.objects.filter(id__in=[row[0] for row in rows], status='pending').update(
+        status=status, updated_at=timezone.now()
+    )
+    deltas = {}
+    for _, tutor_id, net in rows:
+        deltas[tutor_id] = ledger.merge(
+            deltas.get(tutor_id, {}), ledger.earning_deltas('pending', net, sign=-1), ledger.earning_deltas(status, net)
+        )
+    ledger.apply_many(deltas)
+    if status == 'cancelled':
+        # As Earning.save() does: cancelled earnings leave buckets that may already be cached
+        for tutor_id in deltas:
+            analytics.invalidate(tutor_id)
+    return moved
+
+
+def clear_earnings(batch_size=1000, hold_days=None, now=None, dry_run=False, log=None):
+    """Returns {'cleared': n, 'held': n, 'cancelled': n} for this run"""
+    now = now or timezone.now()
+    hold_days = settings.EARNING_HOLD_DAYS if hold_days is None else hold_days
+    cutoff = now - timedelta(days=hold_days)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    position = (checkpoint.position_at, checkpoint.position_id)
+    cleared = held = cancelled = 0
+
+    # Pass 0: earnings whose money back guarantee was refunded
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Earning.objects.filter(
+                    status='pending', id__gt=last_id, course_enrollment__money_back_guarantee__refund_processed=True,
+                )
+                .select_for_update(of=('self',))
+                .order_by('id')
+                .values_list('id', 'tutor_id', 'net_earning')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            cancelled += _move(rows, 'cancelled', dry_run)
+
+    # Pass 1: earnings that crossed the hold window since the high-water mark
+    while True:
+        with transaction.atomic():
+            pending = Earning.objects.filter(status='pending', created_at__lte=cutoff)
+            if position[0]:
+                pending = pending.filter(Q(created_at__gt=position[0]) | Q(created_at=position[0], id__gt=position[1]))
+            rows = list(
+                pending.select_for_update(of=('self',))
+                .annotate(held=_guarantee_hold(now))
+                .order_by('created_at', 'id')
+                .values_list('id', 'tutor_id', 'net_earning', 'created_at', 'held')[:batch_size]
+            )
+            if not rows:
+                break
+            batch_held = sum(1 for row in rows if row[4])
+            held += batch_held
+            cleared += _move([row[:3] for row in rows if not row[4]], 'available', dry_run)
+            position = (rows[-1][3], rows[-1][0])
+            if not dry_run:
+                checkpoint.position_at, checkpoint.position_id = position
+                checkpoint.save(update_fields=['position_at', 'position_id', 'updated_at'])
+        if log:
+            log(f'Cleared {cleared} earnings ({held} held by money back guarantees)...')
+
+    # Pass 2: earnings behind the mark whose guarantee ran out since the last run
+    if checkpoint.last_run_at:
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    Earning.objects.filter(
+                        status='pending', created_at__lte=cutoff, id__gt=last_id,
+                        course_enrollment__money_back_guarantee__refund_processed=False,
+                        course_enrollment__money_back_guarantee__guarantee_expiry_date__gt=checkpoint.last_run_at,
+                        course_enrollment__money_back_guarantee__guarantee_expiry_date__lte=now,
+                    )
+                    .select_for_update(of=('self',))
+                    .order_by('id')
+                    .values_list('id', 'tutor_id', 'net_earning')[:batch_size]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                cleared += _move(rows, 'available', dry_run)
+
+    if not dry_run:
+        checkpoint.last_run_at = now
+        checkpoint.save(update_fields=['last_run_at', 'updated_at'])
+    return {'cleared': cleared, 'held': held, 'cancelled': cancelled}
@@ -0,0 +1,156 @@
+"""
+Maintains TutorBalance, the per-tutor running totals behind the earnings dashboard.
+
+Earning.save()/PayoutRequest.save() call into here inside their own
+transaction, with the row's previous state read back from the database under
+a row lock (locked_state), never from the instance: an instance loaded before
+a queryset.update() or a concurrent save would count the difference twice.
+Code that changes rows with queryset.update() or bulk_create() must call
+apply() or refresh_balances() for the tutors it touched.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.utils import timezone
+
+BALANCE_FIELDS = ('total_earned', 'pending_clearance', 'available', 'total_withdrawn', 'pending_withdrawal')
+
+# Which balance each status counts towards (total_earned counts every earning).
+# Withdrawn earnings stay in 'available' because the money that left is already
+# counted once in total_withdrawn via the processed payout.
+EARNING_STATUS_FIELD = {'pending': 'pending_clearance', 'available': 'available', 'withdrawn': 'available'}
+PAYOUT_STATUS_FIELD = {'requested': 'pending_withdrawal', 'processed': 'total_withdrawn'}
+
+
+def earning_deltas(status, net_earning, sign=1):
+    net_earning = (net_earning or Decimal('0')) * sign
+    deltas = {'total_earned': net_earning}
+    if status in EARNING_STATUS_FIELD:
+        deltas[EARNING_STATUS_FIELD[status]] = net_earning
+    return deltas
+
+
+def payout_deltas(status, amount, sign=1):
+    if status in PAYOUT_STATUS_FIELD:
+        return {PAYOUT_STATUS_FIELD[status]: (amount or Decimal('0')) * sign}
+    return {}
+
+
+def merge(*deltas):
+    merged = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] = merged.get(field, Decimal('0')) + value
+    return {field: value for field, value in merged.items() if value}
+
+
+def locked_state(model, pk, fields):
+    """A row's stored (tutor_id, status, amount), locked until the transaction ends; None if it isn't saved"""
+    if pk is None:
+        return None
+    return model.objects.select_for_update().filter(pk=pk).values_list(*fields).first()
+
+
+def saved_state(instance, old, fields, update_fields=None):
+    """The state save() wrote: fields left out of update_fields keep their stored values"""
+    if update_fields is None or old is None:
+        return tuple(getattr(instance, field) for field in fields)
+    update_fields = set(update_fields)
+    return tuple(
+        getattr(instance, field) if field in update_fields or field.removesuffix('_id') in update_fields else stored
+        for field, stored in zip(fields, old)
+    )
+
+
+def sync(old, new, deltas_for):
+    """Move a row's contribution from its old (tutor_id, status, amount) state to the new one"""
+    if old == new:
+        return
+    if old and old[0] != new[0]:
+        apply(old[0], deltas_for(old[1], old[2], sign=-1))
+        old = None
+    apply(new[0], merge(
+        deltas_for(old[1], old[2], sign=-1) if old else {},
+        deltas_for(new[1], new[2]),
+    ))
+
+
+def apply(tutor_id, deltas):
+    """Add deltas to a tutor's balance row with a single UPDATE (creating the row if needed)"""
+    from .models import TutorBalance
+    if not deltas:
+        return
+    with transaction.atomic():
+        # Hold the row lock (creating the row if needed) before touching it, as payout requests do,
+        # so a concurrent first movement waits here instead of overwriting this one's rebuild
+        _, created = TutorBalance.objects.select_for_update().get_or_create(tutor_id=tutor_id)
+        if created:
+            # First movement for this tutor: build the row from scratch, which already includes deltas
+            refresh_balances([tutor_id])
+        else:
+            TutorBalance.objects.filter(tutor_id=tutor_id).update(
+                updated_at=timezone.now(), **{field: F(field) + value for field, value in deltas.items()}
+            )
+
+
+def apply_many(deltas_by_tutor, batch_size=500):
+    """apply() for many tutors at once: one UPDATE with a CASE per field for each batch of tutors"""
+    from .models import TutorBalance
+    deltas_by_tutor = {tutor_id: deltas for tutor_id, deltas in deltas_by_tutor.items() if deltas}
+    tutor_ids = list(deltas_by_tutor)
+    with transaction.atomic():
+        for i in range(0, len(tutor_ids), batch_size):
+            batch = tutor_ids[i:i + batch_size]
+            fields = {field for tutor_id in batch for field in deltas_by_tutor[tutor_id]}
+            updates = {
+                field: F(field) + Case(
+                    *[When(tutor_id=tutor_id, then=Value(deltas_by_tutor[tutor_id][field]))
+                      for tutor_id in batch if field in deltas_by_tutor[tutor_id]],
+                    default=Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                )
+                for field in fields
+            }
+            updated = TutorBalance.objects.filter(tutor_id__in=batch).update(updated_at=timezone.now(), **updates)
+            if updated < len(batch):
+                existing = set(TutorBalance.objects.filter(tutor_id__in=batch).values_list('tutor_id', flat=True))
+                refresh_balances([tutor_id for tutor_id in batch if tutor_id not in existing])
+
+
+def refresh_balances(tutor_ids=None):
+    """Recompute balances from Earning and PayoutRequest (all tutors when tutor_ids is None)"""
+    from .models import Earning, PayoutRequest, TutorBalance
+
+    earnings = Earning.objects.all()
+    payouts = PayoutRequest.objects.all()
+    if tutor_ids is not None:
+        earnings = earnings.filter(tutor_id__in=tutor_ids)
+        payouts = payouts.filter(tutor_id__in=tutor_ids)
+
+    balances = {}
+    for row in earnings.order_by().values('tutor_id').annotate(
+        total_earned=Sum('net_earning'),
+        pending_clearance=Sum('net_earning', filter=Q(status='pending')),
+        available=Sum('net_earning', filter=Q(status__in=['available', 'withdrawn'])),
+    ):
+        balances[row.pop('tutor_id')] = row
+    for row in payouts.order_by().values('tutor_id').annotate(
+        total_withdrawn=Sum('amount', filter=Q(status='processed')),
+        pending_withdrawal=Sum('amount', filter=Q(status='requested')),
+    ):
+        balances.setdefault(row.pop('tutor_id'), {}).update(row)
+
+    rows = [
+        TutorBalance(tutor_id=tutor_id, **{field: values.get(field) or Decimal('0') for field in BALANCE_FIELDS})
+        for tutor_id, values in balances.items()
+    ]
+    with transaction.atomic():
+        if tutor_ids is not None:
+            # Tutors with no remaining rows go back to zero
+            TutorBalance.objects.filter(tutor_id__in=tutor_ids).exclude(tutor_id__in=balances).update(
+                updated_at=timezone.now(), **{field: Decimal('0') for field in BALANCE_FIELDS}
+            )
+        TutorBalance.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True, unique_fields=['tutor'], update_fields=[*BALANCE_FIELDS, 'updated_at']
+        )
+    return len(rows)
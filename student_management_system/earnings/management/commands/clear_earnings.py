@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from earnings.clearance import clear_earnings
+
+
+class Command(BaseCommand):
+    help = 'Make pending earnings available once their hold period (and money back guarantee) is over, cancel refunded ones (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Earnings updated per UPDATE statement')
+        parser.add_argument('--hold-days', type=int, help='Override settings.EARNING_HOLD_DAYS')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything')
+
+    def handle(self, *args, **options):
+        result = clear_earnings(
+            batch_size=options['batch_size'], hold_days=options['hold_days'], dry_run=options['dry_run'], log=self.stdout.write
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: {result['cleared']} earnings would be cleared, {result['cancelled']} cancelled (guarantee refunded)"
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Cleared {result['cleared']} earnings, {result['held']} still held by money back guarantees, "
+            f"{result['cancelled']} cancelled because the guarantee was refunded"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from earnings.ledger import refresh_balances
+
+
+class Command(BaseCommand):
+    help = 'Recompute every tutor balance row from Earning and PayoutRequest (repairs ledger drift)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tutor', type=int, action='append', dest='tutor_ids', help='Only rebuild these tutor ids')
+
+    def handle(self, *args, **options):
+        count = refresh_balances(options['tutor_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} tutor balances'))
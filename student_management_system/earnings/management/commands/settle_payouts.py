@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from earnings.settlement import settle_payouts, write_settlement_csv
+
+
+class Command(BaseCommand):
+    help = 'Settle requested payouts in one batch and write the settlement file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payout', type=int, action='append', dest='payout_ids', help='Only settle these payout ids')
+        parser.add_argument('--limit', type=int, help='Settle at most this many (oldest first)')
+        parser.add_argument('--notes', default='')
+        parser.add_argument('--output', help='Defaults to <reference>.csv')
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit must be a positive integer')
+        result = settle_payouts(payout_ids=options['payout_ids'], limit=options['limit'], notes=options['notes'])
+
+        for skipped in result['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped payout {skipped['payout_id']}: tutor {skipped['tutor_id']} has {skipped['cleared']} "
+                f"cleared for {skipped['batch_total']} requested"
+            ))
+        if not result['rows']:
+            self.stdout.write('No payouts settled')
+            return
+
+        output = options['output'] or f"{result['reference']}.csv"
+        with open(output, 'w', newline='') as f:
+            write_settlement_csv(result['rows'], f)
+        total = sum(row['amount'] for row in result['rows'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Settled {len(result['rows'])} payouts ({total}) as {result['reference']}, "
+            f"{result['earnings_withdrawn']} earnings withdrawn, settlement file {output}"
+        ))
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Q, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Earning = apps.get_model('earnings', 'Earning')
+    PayoutRequest = apps.get_model('earnings', 'PayoutRequest')
+    TutorBalance = apps.get_model('earnings', 'TutorBalance')
+
+    balances = {}
+    for row in Earning.objects.order_by().values('tutor_id').annotate(
+        total_earned=Sum('net_earning'),
+        pending_clearance=Sum('net_earning', filter=Q(status='pending')),
+        available=Sum('net_earning', filter=Q(status='available')),
+    ):
+        balances[row.pop('tutor_id')] = row
+    for row in PayoutRequest.objects.order_by().values('tutor_id').annotate(
+        total_withdrawn=Sum('amount', filter=Q(status='processed')),
+        pending_withdrawal=Sum('amount', filter=Q(status='requested')),
+    ):
+        balances.setdefault(row.pop('tutor_id'), {}).update(row)
+
+    TutorBalance.objects.bulk_create([
+        TutorBalance(tutor_id=tutor_id, **{field: value or 0 for field, value in values.items()})
+        for tutor_id, values in balances.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_is_approved'),
+        ('earnings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TutorBalance',
+            fields=[
+                ('tutor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_earned', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_clearance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('available', models.DecimalField(decimal_places=2, default=0, help_text="Sum of earnings in 'available' status", max_digits=12)),
+                ('total_withdrawn', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_withdrawal', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
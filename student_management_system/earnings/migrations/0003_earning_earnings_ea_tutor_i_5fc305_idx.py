@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings', '0002_tutorbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='earning',
+            index=models.Index(fields=['tutor', 'created_at'], name='earnings_ea_tutor_i_5fc305_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings', '0003_earning_earnings_ea_tutor_i_5fc305_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tutorbalance',
+            name='available',
+            field=models.DecimalField(decimal_places=2, default=0, help_text="Sum of cleared earnings ('available' or 'withdrawn' status)", max_digits=12),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings', '0005_jobcheckpoint_earning_earnings_ea_status_4d16be_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='earning',
+            index=models.Index(fields=['updated_at'], name='earnings_ea_updated_558952_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from . import ledger
 
 class Earning(models.Model):
     SOURCE_CHOICES = (
@@ -39,6 +40,13 @@ class Earning(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tutor', 'created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['updated_at']),
+        ]
+
+    LEDGER_FIELDS = ('tutor_id', 'status', 'net_earning')
 
     def save(self, *args, **kwargs):
         if not self.net_earning:
@@ -46,7 +54,24 @@ class Earning(models.Model):
             if self.admin_commission is None:
                 self.admin_commission = 0
             self.net_earning = self.amount - self.admin_commission
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            old = ledger.locked_state(Earning, self.pk, self.LEDGER_FIELDS)
+            super().save(*args, **kwargs)
+            ledger.sync(old, ledger.saved_state(self, old, self.LEDGER_FIELDS, kwargs.get('update_fields')), ledger.earning_deltas)
+        if old and (old[1] == 'cancelled') != (self.status == 'cancelled'):
+            # Cancelling (or restoring) an earning changes a bucket that may already be cached
+            from . import analytics
+            analytics.invalidate(self.tutor_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            state = ledger.locked_state(Earning, self.pk, self.LEDGER_FIELDS)
+            result = super().delete(*args, **kwargs)
+            if state:
+                ledger.apply(state[0], ledger.earning_deltas(state[1], state[2], sign=-1))
+        from . import analytics
+        analytics.invalidate(self.tutor_id)
+        return result
         
     def __str__(self):
         return f"{self.tutor.username} - {self.amount} ({self.status})"
@@ -70,5 +95,52 @@ class PayoutRequest(models.Model):
     class Meta:
         ordering = ['-requested_at']
 
+    LEDGER_FIELDS = ('tutor_id', 'status', 'amount')
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old = ledger.locked_state(PayoutRequest, self.pk, self.LEDGER_FIELDS)
+            super().save(*args, **kwargs)
+            ledger.sync(old, ledger.saved_state(self, old, self.LEDGER_FIELDS, kwargs.get('update_fields')), ledger.payout_deltas)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            state = ledger.locked_state(PayoutRequest, self.pk, self.LEDGER_FIELDS)
+            result = super().delete(*args, **kwargs)
+            if state:
+                ledger.apply(state[0], ledger.payout_deltas(state[1], state[2], sign=-1))
+        return result
+
     def __str__(self):
         return f"Payout {self.id} - {self.tutor.username} - {self.amount}"
+
+class TutorBalance(models.Model):
+    """Running totals per tutor, kept in step with Earning and PayoutRequest by earnings.ledger"""
+    tutor = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    total_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_clearance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    available = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of cleared earnings ('available' or 'withdrawn' status)")
+    total_withdrawn = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_withdrawal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def withdrawable(self):
+        return max(0, self.available - (self.total_withdrawn + self.pending_withdrawal))
+
+    def __str__(self):
+        return f"Balance - {self.tutor_id}"
+
+class JobCheckpoint(models.Model):
+    """
+    High-water mark of an incremental job, so each run only looks at rows added since the last one.
+    Also used by payments.rollups, which depends on the earnings app already (Earning).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position_at = models.DateTimeField(null=True, blank=True)
+    position_id = models.BigIntegerField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position_at} / {self.position_id}"
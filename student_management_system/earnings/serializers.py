@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Earning, PayoutRequest
+from .models import Earning, PayoutRequest, TutorBalance
 from accounts.serializers import UserSerializer
 
 class EarningSerializer(serializers.ModelSerializer):
@@ -20,11 +20,9 @@ class PayoutRequestSerializer(serializers.ModelSerializer):
         # Check if tutor has enough available earnings
         user = self.context['request'].user
         
-        # Calculate available balance
-        total_earned = sum(e.net_earning for e in Earning.objects.filter(tutor=user, status='available'))
-        total_withdrawn = sum(p.amount for p in PayoutRequest.objects.filter(tutor=user, status__in=['requested', 'processed']))
-        
-        available_balance = total_earned - total_withdrawn
+        # Early check for a friendly error; perform_create re-checks under a row lock
+        balance = TutorBalance.objects.filter(tutor=user).first()
+        available_balance = balance.withdrawable if balance else 0
         
         if value > available_balance:
             raise serializers.ValidationError(f"Insufficient funds. Available balance: {available_balance}")
@@ -0,0 +1,138 @@
+"""
+Month-end payout settlement in batches.
+
+A batch locks the selected 'requested' payouts, checks every tutor's cleared
+balance in one grouped query, marks the payouts processed and the covered
+earnings withdrawn with set-based UPDATEs, and returns the rows for the
+settlement file. Everything happens in one transaction, so a failed batch
+leaves nothing half-settled.
+"""
+import csv
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from . import ledger
+from .models import Earning, PayoutRequest, TutorBalance
+
+SETTLEMENT_FIELDS = ['reference', 'payout_id', 'tutor_id', 'tutor_username', 'tutor_email', 'amount', 'requested_at']
+
+
+def new_reference():
+    return f"SETTLE-{timezone.now():%Y%m%d%H%M%S}-{get_random_string(6).upper()}"
+
+
+def _mark_earnings_withdrawn(tutor_ids):
+    """Mark the oldest available earnings withdrawn, up to what each tutor has been paid out"""
+    paid = dict(
+        TutorBalance.objects.filter(tutor_id__in=tutor_ids).values_list('tutor_id', 'total_withdrawn')
+    )
+    for row in Earning.objects.filter(tutor_id__in=tutor_ids, status='withdrawn').order_by().values('tutor_id').annotate(
+        covered=Sum('net_earning')
+    ):
+        paid[row['tutor_id']] -= row['covered']
+
+    covered_ids = []
+    remaining = dict(paid)
+    for earning_id, tutor_id, net in (
+        Earning.objects.filter(tutor_id__in=tutor_ids, status='available')
+        .order_by('tutor_id', 'created_at', 'id')
+        .values_list('id', 'tutor_id', 'net_earning')
+    ):
+        # Only whole earnings are covered; a partly paid one stays available until the next batch
+        if net <= remaining.get(tutor_id, 0):
+            remaining[tutor_id] -= net
+            covered_ids.append(earning_id)
+        else:
+            remaining[tutor_id] = 0
+
+    # available -> withdrawn doesn't move any balance (see ledger.EARNING_STATUS_FIELD)
+    for i in range(0, len(covered_ids), 1000):
+        Earning.objects.filter(id__in=covered_ids[i:i + 1000]).update(status='withdrawn', updated_at=timezone.now())
+    return len(covered_ids)
+
+
+def settle_payouts(payout_ids=None, limit=None, reference=None, notes=''):
+    """
+    Settle requested payouts (the given ids, or the oldest `limit` ones, or all).
+
+    Returns a dict with the batch reference, the settled rows for the settlement
+    file, the payouts skipped for insufficient balance, and the number of
+    earnings marked withdrawn. Raises ValueError for a limit below 1.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError('limit must be a positive integer')
+    reference = reference or new_reference()
+    now = timezone.now()
+
+    with transaction.atomic():
+        payouts = PayoutRequest.objects.filter(status='requested').order_by('requested_at', 'id')
+        if payout_ids is not None:
+            payouts = payouts.filter(id__in=payout_ids)
+        payouts = payouts.select_for_update(of=('self',))
+        if limit is not None:
+            payouts = payouts[:limit]
+        locked = list(payouts.values_list('id', 'tutor_id'))
+        if not locked:
+            return {'reference': reference, 'rows': [], 'skipped': [], 'earnings_withdrawn': 0}
+
+        ids = [payout_id for payout_id, _ in locked]
+        tutor_ids = sorted({tutor_id for _, tutor_id in locked})
+        # Same lock order as PayoutRequestViewSet.perform_create so new requests wait for us
+        list(TutorBalance.objects.select_for_update().filter(tutor_id__in=tutor_ids).values_list('tutor_id'))
+
+        # One grouped query: tutors whose batch total exceeds their cleared, not yet withdrawn money
+        short = {
+            row['tutor_id']: row
+            for row in PayoutRequest.objects.filter(id__in=ids).order_by()
+            .values('tutor_id')
+            .annotate(
+                batch_total=Sum('amount'),
+                cleared=Coalesce('tutor__balance__available', Value(Decimal('0')))
+                - Coalesce('tutor__balance__total_withdrawn', Value(Decimal('0'))),
+            )
+            .filter(batch_total__gt=F('cleared'))
+        }
+        settled_ids = [payout_id for payout_id, tutor_id in locked if tutor_id not in short]
+        skipped = [
+            {'payout_id': payout_id, 'tutor_id': tutor_id,
+             'batch_total': short[tutor_id]['batch_total'], 'cleared': short[tutor_id]['cleared']}
+            for payout_id, tutor_id in locked if tutor_id in short
+        ]
+
+        rows, totals = [], {}
+        for i in range(0, len(settled_ids), 1000):
+            chunk = settled_ids[i:i + 1000]
+            for payout in (
+                PayoutRequest.objects.filter(id__in=chunk).order_by('requested_at', 'id')
+                .values('id', 'tutor_id', 'tutor__username', 'tutor__email', 'amount', 'requested_at')
+            ):
+                totals[payout['tutor_id']] = totals.get(payout['tutor_id'], Decimal('0')) + payout['amount']
+                rows.append({
+                    'reference': reference,
+                    'payout_id': payout['id'],
+                    'tutor_id': payout['tutor_id'],
+                    'tutor_username': payout['tutor__username'],
+                    'tutor_email': payout['tutor__email'],
+                    'amount': payout['amount'],
+                    'requested_at': payout['requested_at'].isoformat(),
+                })
+            PayoutRequest.objects.filter(id__in=chunk).update(
+                status='processed', transaction_id=reference, processed_at=now, **({'notes': notes} if notes else {})
+            )
+
+        ledger.apply_many({
+            tutor_id: ledger.merge(ledger.payout_deltas('requested', total, sign=-1), ledger.payout_deltas('processed', total))
+            for tutor_id, total in totals.items()
+        })
+        earnings_withdrawn = _mark_earnings_withdrawn(list(totals))
+
+    return {'reference': reference, 'rows': rows, 'skipped': skipped, 'earnings_withdrawn': earnings_withdrawn}
+
+
+def write_settlement_csv(rows, f):
+    writer = csv.DictWriter(f, fieldnames=SETTLEMENT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
@@ -1,9 +1,14 @@
 from rest_framework import viewsets, permissions, status, decorators
 from rest_framework.response import Response
-from django.db.models import Sum, Q
+from django.db import transaction
 from django.utils import timezone
-from .models import Earning, PayoutRequest
+from rest_framework.exceptions import ValidationError
+from .models import Earning, PayoutRequest, TutorBalance
 from .serializers import EarningSerializer, PayoutRequestSerializer
+from .analytics import TRUNC, earnings_timeseries
+from .settlement import settle_payouts, write_settlement_csv
+from django.http import HttpResponse
+from django.utils.dateparse import parse_date
 
 class EarningViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = EarningSerializer
@@ -34,35 +39,53 @@ class EarningViewSet(viewsets.ReadOnlyModelViewSet):
         else:
             tutor = user
 
-        # Calculate stats
-        earnings = Earning.objects.filter(tutor=tutor)
-        payouts = PayoutRequest.objects.filter(tutor=tutor)
-        
-        total_earned = earnings.aggregate(sum=Sum('net_earning'))['sum'] or 0
-        pending_clearance = earnings.filter(status='pending').aggregate(sum=Sum('net_earning'))['sum'] or 0
-        available_balance = earnings.filter(status='available').aggregate(sum=Sum('net_earning'))['sum'] or 0
-        
-        total_withdrawn = payouts.filter(status='processed').aggregate(sum=Sum('amount'))['sum'] or 0
-        pending_withdrawal = payouts.filter(status='requested').aggregate(sum=Sum('amount'))['sum'] or 0
-        
-        # Real available balance = Available Earnings - (Processed Withdrawals + Pending Withdrawals)
-        # Note: In a real system, we might mark earnings as 'withdrawn' when payout is processed
-        # But here we calculate dynamically.
-        
-        # To avoid double counting, let's assume 'available' status in Earning means it CAN be withdrawn.
-        # Once withdrawn, we don't change Earning status to 'withdrawn' unless we want to link them 1-to-1.
-        # Simpler approach: Balance = (Sum of 'available' earnings) - (Sum of 'requested' + 'processed' payouts)
-        
-        current_balance = available_balance - (total_withdrawn + pending_withdrawal)
+        # Balances are maintained by earnings.ledger, so this is a single primary-key read
+        balance = TutorBalance.objects.filter(tutor=tutor).first() or TutorBalance(tutor=tutor)
         
         return Response({
-            'total_earned': total_earned,
-            'pending_clearance': pending_clearance,
-            'available_balance': max(0, current_balance), # Should not be negative
-            'total_withdrawn': total_withdrawn,
-            'pending_withdrawal': pending_withdrawal
+            'total_earned': balance.total_earned,
+            'pending_clearance': balance.pending_clearance,
+            'available_balance': balance.withdrawable,
+            'total_withdrawn': balance.total_withdrawn,
+            'pending_withdrawal': balance.pending_withdrawal
         })
 
+    @decorators.action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """Earnings grouped by day/week/month and source_type; closed buckets are served from cache"""
+        user = request.user
+        if user.user_type != 'tutor' and not user.is_staff:
+            return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        interval = request.query_params.get('interval', 'month')
+        if interval not in TRUNC:
+            return Response({'error': 'interval must be one of day, week, month'}, status=status.HTTP_400_BAD_REQUEST)
+        source_type = request.query_params.get('source_type')
+        if source_type and source_type not in dict(Earning.SOURCE_CHOICES):
+            return Response({'error': 'Invalid source_type'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = parse_date(request.query_params.get('start', ''))
+            end = parse_date(request.query_params.get('end', ''))
+        except ValueError:
+            start = end = None
+        if (request.query_params.get('start') and not start) or (request.query_params.get('end') and not end):
+            return Response({'error': 'start and end must be valid dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user.is_staff:
+            # Admins see the whole platform unless they pick a tutor
+            try:
+                tutor_id = int(request.query_params['tutor_id']) if request.query_params.get('tutor_id') else None
+            except ValueError:
+                return Response({'error': 'tutor_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            tutor_id = user.id
+
+        series = [
+            {**row, 'bucket': row['bucket'].date()}
+            for row in earnings_timeseries(interval, tutor_id=tutor_id, source_type=source_type, start=start, end=end)
+        ]
+        return Response({'interval': interval, 'series': series})
+
 class PayoutRequestViewSet(viewsets.ModelViewSet):
     serializer_class = PayoutRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -79,7 +102,12 @@ class PayoutRequestViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         if self.request.user.user_type != 'tutor':
             raise permissions.PermissionDenied("Only tutors can request payouts")
-        serializer.save(tutor=self.request.user)
+        with transaction.atomic():
+            # Lock the balance row so concurrent requests can't both spend the same money
+            balance, _ = TutorBalance.objects.select_for_update().get_or_create(tutor=self.request.user)
+            if serializer.validated_data['amount'] > balance.withdrawable:
+                raise ValidationError({'amount': [f"Insufficient funds. Available balance: {balance.withdrawable}"]})
+            serializer.save(tutor=self.request.user)
         
     @decorators.action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def process(self, request, pk=None):
@@ -108,3 +136,39 @@ class PayoutRequestViewSet(viewsets.ModelViewSet):
             
         else:
             return Response({'error': 'Invalid action. Use "approve" or "reject"'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @decorators.action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def settle(self, request):
+        """Process many requested payouts in one settlement batch (?output=csv returns the settlement file)"""
+        payout_ids = request.data.get('payout_ids')
+        limit = request.data.get('limit')
+        if payout_ids is not None and not isinstance(payout_ids, list):
+            return Response({'error': 'payout_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Through str() so that floats, booleans and nested values are rejected too
+            payout_ids = [int(str(payout_id)) for payout_id in payout_ids] if payout_ids is not None else None
+        except ValueError:
+            return Response({'error': 'payout_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(str(limit)) if limit is not None else None
+        except ValueError:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit < 1:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = settle_payouts(payout_ids=payout_ids, limit=limit, notes=request.data.get('notes', ''))
+
+        if request.query_params.get('output') == 'csv':
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = f'attachment; filename="{result["reference"]}.csv"'
+            write_settlement_csv(result['rows'], response)
+            return response
+
+        return Response({
+            'reference': result['reference'],
+            'settled': len(result['rows']),
+            'total_amount': sum((row['amount'] for row in result['rows']), 0),
+            'earnings_withdrawn': result['earnings_withdrawn'],
+            'skipped': result['skipped'],
+            'payouts': result['rows'],
+        })
@@ -1,8 +1,13 @@
-import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from chat import presence
+from student_management.websocket import EncodedWebsocketMixin
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+def notification_payload(event):
+    return event['data']
+
+class NotificationConsumer(EncodedWebsocketMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Check authentication
         if not self.scope["user"].is_authenticated:
@@ -18,7 +23,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_negotiated()
+        # An open notification socket means the user is online
+        await sync_to_async(presence.touch)('user', self.user.id, self.channel_name, self.user.id)
 
     async def disconnect(self, close_code):
         # Leave user group
@@ -26,12 +33,17 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name
         )
+        await sync_to_async(presence.leave)('user', self.user.id, self.channel_name)
+        await self.release_rate_limit()
 
     # Receive message from WebSocket (optional, mostly for marking read)
-    async def receive(self, text_data):
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.within_rate_limit():
+            return
+        if self.decode(text_data, bytes_data).get('action') == 'heartbeat':
+            await sync_to_async(presence.touch)('user', self.user.id, self.channel_name, self.user.id)
 
     # Receive notification from group
     async def send_notification(self, event):
         # Send message to WebSocket
-        await self.send(text_data=json.dumps(event['data']))
+        await self.send_event(event, notification_payload)
@@ -1,6 +1,40 @@
+import asyncio
 from django.conf import settings
 from .models import Notification
 
+def _notification_event(notification, sender=None):
+    from student_management.websocket import with_frames
+    from .consumers import notification_payload
+    event = {
+        'type': 'send_notification',
+        'data': {
+            'id': notification.id,
+            'title': notification.title,
+            'message': notification.message,
+            'notification_type': notification.notification_type,
+            'created_at': notification.created_at.isoformat(),
+            'link': notification.link,
+            'sender': sender.username if sender else None
+        }
+    }
+    return f'user_{notification.recipient_id}', with_frames(event, notification_payload)
+
+def _push_notifications(notifications, sender=None):
+    """Send the notifications live, all in one trip to the channel layer"""
+    try:
+        from channels.layers import get_channel_layer
+        from asgiref.sync import async_to_sync
+        channel_layer = get_channel_layer()
+        if channel_layer and notifications:
+            events = [_notification_event(notification, sender) for notification in notifications]
+
+            async def send_all():
+                await asyncio.gather(*[channel_layer.group_send(group_name, event) for group_name, event in events])
+
+            async_to_sync(send_all)()
+    except Exception:
+        pass
+
 def send_notification(recipient, title, message, notification_type='system', sender=None, link=None):
     notification = Notification.objects.create(
         recipient=recipient,
@@ -10,25 +44,11 @@ def send_notification(recipient, title, message, notification_type='system', sen
         notification_type=notification_type,
         link=link
     )
-    try:
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        channel_layer = get_channel_layer()
-        if channel_layer:
-            group_name = f'user_{recipient.id}'
-            event = {
-                'type': 'send_notification',
-                'data': {
-                    'id': notification.id,
-                    'title': notification.title,
-                    'message': notification.message,
-                    'notification_type': notification.notification_type,
-                    'created_at': notification.created_at.isoformat(),
-                    'link': notification.link,
-                    'sender': sender.username if sender else None
-                }
-            }
-            async_to_sync(channel_layer.group_send)(group_name, event)
-    except Exception:
-        pass
+    _push_notifications([notification], sender=sender)
     return notification
+
+def send_bulk_notifications(notifications, batch_size=1000):
+    """Insert unsaved Notification instances with bulk_create and push each one live"""
+    created = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    _push_notifications(created)
+    return created
@@ -0,0 +1,183 @@
+"""
+Streaming finance export of payments with their installments, refunds and earnings.
+
+Payments are walked with a (created_at, id) keyset, one page at a time, and
+each page is encoded straight into a gzip stream, so memory stays flat however
+large the date range is.
+
+export_payments() is a plain generator (the export_payments command).
+aexport_payments() is an async generator for the finance export view: it
+fetches each page through sync_to_async, so the response streams without
+the ORM running on the event loop (see student_management.streaming).
+"""
+import csv
+import io
+import json
+import logging
+import time
+import zlib
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch, Q
+from earnings.models import Earning
+from .models import Payment, Installment, Refund
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = [
+    'payment_id', 'created_at', 'student_id', 'course_id', 'consultancy_session_id', 'amount', 'currency',
+    'payment_method', 'payment_status', 'transaction_id', 'installments', 'installments_paid', 'amount_paid',
+    'amount_unpaid', 'refunds', 'amount_refunded', 'earnings_gross', 'earnings_commission', 'earnings_net',
+]
+
+
+def fetch_page(start, end, cursor=None, page_size=1000):
+    """
+    Export records for the next page of payments created in [start, end) after
+    cursor, and the cursor to continue from ([] and None when there are no more).
+    """
+    payments = (
+        Payment.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by('created_at', 'id')
+        .prefetch_related(
+            Prefetch('installments', queryset=Installment.objects.order_by('installment_number')),
+            Prefetch('refunds', queryset=Refund.objects.order_by('created_at')),
+        )
+    )
+    if cursor:
+        payments = payments.filter(Q(created_at__gt=cursor[0]) | Q(created_at=cursor[0], id__gt=cursor[1]))
+    page = list(payments[:page_size])
+    if not page:
+        return [], None
+    return _records(page), (page[-1].created_at, page[-1].id)
+
+
+def _earnings_for(page):
+    enrollment_ids = [p.enrollment_id for p in page if p.enrollment_id]
+    session_ids = [p.consultancy_session_id for p in page if p.consultancy_session_id]
+    by_enrollment, by_session = {}, {}
+    earnings = Earning.objects.filter(
+        Q(course_enrollment_id__in=enrollment_ids) | Q(consultancy_session_id__in=session_ids)
+    ).order_by('id')
+    for earning in earnings:
+        if earning.course_enrollment_id:
+            by_enrollment.setdefault(earning.course_enrollment_id, []).append(earning)
+        elif earning.consultancy_session_id:
+            by_session.setdefault(earning.consultancy_session_id, []).append(earning)
+    return by_enrollment, by_session
+
+
+def _records(page):
+    by_enrollment, by_session = _earnings_for(page)
+    records = []
+    for payment in page:
+        if payment.enrollment_id:
+            earnings = by_enrollment.get(payment.enrollment_id, [])
+        else:
+            earnings = by_session.get(payment.consultancy_session_id, [])
+        records.append({
+            'payment_id': payment.id,
+            'created_at': payment.created_at.isoformat(),
+            'student_id': payment.student_id,
+            'course_id': payment.course_id,
+            'consultancy_session_id': payment.consultancy_session_id,
+            'amount': str(payment.amount),
+            'currency': payment.currency,
+            'payment_method': payment.payment_method,
+            'payment_status': payment.payment_status,
+            'transaction_id': payment.transaction_id,
+            'installments': [
+                {'id': i.id, 'number': i.installment_number, 'amount': str(i.amount), 'status': i.status,
+                 'due_date': i.due_date.isoformat(), 'paid_date': i.paid_date.isoformat() if i.paid_date else None}
+                for i in payment.installments.all()
+            ],
+            'refunds': [
+                {'id': r.id, 'amount': str(r.amount), 'status': r.status, 'refund_id': r.refund_id,
+                 'created_at': r.created_at.isoformat()}
+                for r in payment.refunds.all()
+            ],
+            'earnings': [
+                {'id': e.id, 'tutor_id': e.tutor_id, 'amount': str(e.amount), 'commission': str(e.admin_commission),
+                 'net': str(e.net_earning), 'status': e.status}
+                for e in earnings
+            ],
+        })
+    return records
+
+
+def _total(amounts):
+    return sum((Decimal(amount) for amount in amounts), Decimal('0'))
+
+
+def _csv_row(record):
+    installments, refunds, earnings = record['installments'], record['refunds'], record['earnings']
+    paid = [i for i in installments if i['status'] == 'paid']
+    unpaid = [i for i in installments if i['status'] in Installment.UNPAID_STATUSES]
+    row = {key: record[key] for key in CSV_FIELDS if key in record and not isinstance(record[key], list)}
+    row.update({
+        'installments': len(installments),
+        'installments_paid': len(paid),
+        'amount_paid': _total(i['amount'] for i in paid),
+        'amount_unpaid': _total(i['amount'] for i in unpaid),
+        'refunds': len(refunds),
+        'amount_refunded': _total(r['amount'] for r in refunds if r['status'] == 'completed'),
+        'earnings_gross': _total(e['amount'] for e in earnings),
+        'earnings_commission': _total(e['commission'] for e in earnings),
+        'earnings_net': _total(e['net'] for e in earnings),
+    })
+    return row
+
+
+class ExportEncoder:
+    """Encodes pages of records as gzipped CSV (one flat row per payment) or JSONL (nested)"""
+
+    def __init__(self, export_format):
+        self.export_format = export_format
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        self.buffer = io.StringIO()
+        if export_format == 'csv':
+            self.writer = csv.DictWriter(self.buffer, fieldnames=CSV_FIELDS)
+            self.writer.writeheader()
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def encode(self, records):
+        for record in records:
+            if self.export_format == 'jsonl':
+                self.buffer.write(json.dumps(record) + '\n')
+            else:
+                self.writer.writerow(_csv_row(record))
+        self.rows += len(records)
+        data = self.compressor.compress(self.buffer.getvalue().encode())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def finish(self, stats, start, end):
+        """The end of the gzip stream; rows and rows/sec are written to stats"""
+        stats['rows'] = self.rows
+        stats['seconds'] = time.monotonic() - self.started
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else stats['rows']
+        logger.info('Payment export %s..%s: %d rows in %.2fs (%.0f rows/sec)',
+                    start, end, stats['rows'], stats['seconds'], stats['rows_per_sec'])
+        return self.compressor.flush()
+
+
+def export_payments(start, end, export_format='csv', page_size=1000, stats=None):
+    """Gzipped byte chunks for the export; rows and rows/sec are written to stats when it finishes"""
+    encoder = ExportEncoder(export_format)
+    records, cursor = fetch_page(start, end, None, page_size)
+    while records:
+        yield encoder.encode(records)
+        records, cursor = fetch_page(start, end, cursor, page_size)
+    yield encoder.finish(stats if stats is not None else {}, start, end)
+
+
+async def aexport_payments(start, end, export_format='csv', page_size=1000, stats=None):
+    """export_payments() as an async generator, querying one page at a time through sync_to_async"""
+    encoder = ExportEncoder(export_format)
+    records, cursor = await sync_to_async(fetch_page)(start, end, None, page_size)
+    while records:
+        yield encoder.encode(records)
+        records, cursor = await sync_to_async(fetch_page)(start, end, cursor, page_size)
+    yield encoder.finish(stats if stats is not None else {}, start, end)
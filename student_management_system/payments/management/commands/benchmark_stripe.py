@@ -0,0 +1,52 @@
+import asyncio
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments import stripe_client
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent payment intent requests through the Stripe client and report latency (use with fake_stripe_server)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32, help='Simulated concurrent callers')
+
+    def handle(self, *args, **options):
+        if not settings.STRIPE_API_BASE:
+            self.stdout.write(self.style.WARNING('STRIPE_API_BASE is not set; this will hit the real Stripe API'))
+
+        async def one(callers):
+            async with callers:
+                started = time.perf_counter()
+                try:
+                    await stripe_client.create_payment_intent(amount=1000, currency='usd', idempotency_key=f'benchmark-{uuid.uuid4()}')
+                    outcome = 'ok'
+                except stripe_client.StripeUnavailable:
+                    outcome = 'unavailable'
+                except Exception:
+                    outcome = 'error'
+                return outcome, time.perf_counter() - started
+
+        async def run():
+            # Like that many requests in flight on the payment views
+            callers = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*[one(callers) for _ in range(options['requests'])])
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        outcomes = {}
+        for outcome, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f'{len(results)} calls in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), '
+                          f'pool size {settings.STRIPE_MAX_CONCURRENCY}, timeout {settings.STRIPE_TIMEOUT}s')
+        self.stdout.write(f'p50 {percentile(0.5):.0f}ms  p95 {percentile(0.95):.0f}ms  p99 {percentile(0.99):.0f}ms  max {latencies[-1] * 1000:.0f}ms')
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{k}: {v}' for k, v in sorted(outcomes.items()))))
@@ -0,0 +1,116 @@
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from django.core.management.base import BaseCommand
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Answers the handful of Stripe endpoints the payments app uses"""
+    latency = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    intents = {}
+    # Idempotency-Key -> response body, like Stripe's replay of a retried create
+    replies = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def simulate(self):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.fail_rate:
+            self.respond(500, {'error': {'type': 'api_error', 'message': 'Simulated Stripe outage'}})
+            return False
+        return True
+
+    def form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return {key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+    def do_POST(self):
+        data = self.form()
+        if not self.simulate():
+            return
+        key = self.headers.get('Idempotency-Key')
+        if key and key in self.replies:
+            self.respond(200, self.replies[key])
+            return
+        if self.path == '/v1/payment_intents':
+            intent_id = f'pi_{uuid.uuid4().hex[:24]}'
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(data.get('amount', 0)),
+                'currency': data.get('currency', 'usd'),
+                'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:24]}',
+                # Pretend the client confirmed it straight away so /confirm/ succeeds
+                'status': 'succeeded',
+            }
+            self.intents[intent_id] = intent
+            self.reply(key, intent)
+        elif self.path.startswith('/v1/payment_intents/') and self.path.endswith('/cancel'):
+            intent = self.intents.get(self.path.split('/')[3])
+            if intent:
+                intent['status'] = 'canceled'
+                self.respond(200, intent)
+            else:
+                self.respond(404, {'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}})
+        elif self.path == '/v1/refunds':
+            self.reply(key, {
+                'id': f're_{uuid.uuid4().hex[:24]}',
+                'object': 'refund',
+                'amount': int(data.get('amount', 0)),
+                'payment_intent': data.get('payment_intent'),
+                'status': 'succeeded',
+            })
+        else:
+            self.respond(404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL (POST: {self.path})'}})
+
+    def reply(self, key, body):
+        if key:
+            self.replies[key] = body
+        self.respond(200, body)
+
+    def do_GET(self):
+        if not self.simulate():
+            return
+        intent_id = self.path.rsplit('/', 1)[-1]
+        if self.path.startswith('/v1/payment_intents/') and intent_id in self.intents:
+            self.respond(200, self.intents[intent_id])
+        else:
+            self.respond(404, {'error': {'type': 'invalid_request_error', 'message': f'No such payment_intent: {intent_id}'}})
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake Stripe API (set STRIPE_API_BASE=http://127.0.0.1:<port>) for testing and latency benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, up to this value')
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with a 500')
+
+    def handle(self, *args, **options):
+        FakeStripeHandler.latency = options['latency']
+        FakeStripeHandler.jitter = options['jitter']
+        FakeStripeHandler.fail_rate = options['fail_rate']
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), FakeStripeHandler)
+        self.stdout.write(self.style.SUCCESS(f'Fake Stripe listening on http://127.0.0.1:{options["port"]}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
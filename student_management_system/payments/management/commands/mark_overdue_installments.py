@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from notifications.models import Notification
+from notifications.utils import send_bulk_notifications
+from payments.models import Installment
+
+class Command(BaseCommand):
+    help = 'Mark past-due pending installments as overdue and remind the affected students (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Installments updated per UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing anything')
+        parser.add_argument('--no-email', action='store_true', help='Only create in-app notifications')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        now = timezone.now()
+
+        # student_id -> [installment count, total amount]
+        affected = {}
+        marked = 0
+        last_id = 0
+
+        while True:
+            with transaction.atomic():
+                # Keyset over the (status, due_date) index; rows locked by a
+                # concurrent payment are skipped and picked up on the next run.
+                # Payments still 'pending' never got past checkout (the first
+                # installment is due at checkout), so they are left alone.
+                rows = list(
+                    Installment.objects
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .filter(status='pending', due_date__lt=now, id__gt=last_id)
+                    .exclude(payment__payment_status='pending')
+                    .order_by('id')
+                    .values_list('id', 'payment__student_id', 'amount')[:batch_size]
+                )
+                if not rows:
+                    break
+
+                ids = [row[0] for row in rows]
+                last_id = ids[-1]
+                if not dry_run:
+                    marked += Installment.objects.filter(id__in=ids, status='pending').update(status='overdue', updated_at=now)
+                else:
+                    marked += len(ids)
+
+            for _, student_id, amount in rows:
+                entry = affected.setdefault(student_id, [0, 0])
+                entry[0] += 1
+                entry[1] += amount
+
+            self.stdout.write(f'Processed {marked} installments...')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run: {marked} installments for {len(affected)} students would be marked overdue'))
+            return
+
+        if affected:
+            self.notify_students(affected, send_email=not options['no_email'])
+
+        self.stdout.write(self.style.SUCCESS(f'Marked {marked} installments overdue for {len(affected)} students'))
+
+    def notify_students(self, affected, send_email=True):
+        notifications = [
+            Notification(
+                recipient_id=student_id,
+                title='Installment Overdue',
+                message=self.reminder_text(count, amount),
+                notification_type='payment',
+                link='/payment'
+            )
+            for student_id, (count, amount) in affected.items()
+        ]
+        send_bulk_notifications(notifications)
+        self.stdout.write(f'Created {len(notifications)} reminder notifications')
+
+        if not send_email:
+            return
+
+        sent = 0
+        connection = get_connection(fail_silently=True)
+        connection.open()
+        try:
+            student_ids = list(affected)
+            for start in range(0, len(student_ids), 1000):
+                messages = []
+                students = (
+                    User.objects.filter(id__in=student_ids[start:start + 1000])
+                    .exclude(email='')
+                    .only('id', 'username', 'email')
+                )
+                for student in students:
+                    count, amount = affected[student.id]
+                    messages.append(EmailMessage(
+                        'Installment Overdue',
+                        f'Hello {student.username},\n\n{self.reminder_text(count, amount)}\n\n'
+                        f'Pay now: {settings.FRONTEND_URL}/payment\n\nBest regards,\nEduSystem Team',
+                        settings.DEFAULT_FROM_EMAIL,
+                        [student.email],
+                    ))
+                sent += connection.send_messages(messages) or 0
+        finally:
+            connection.close()
+
+        self.stdout.write(f'Sent {sent} reminder emails')
+
+    @staticmethod
+    def reminder_text(count, amount):
+        if count == 1:
+            return f'Your installment of {amount} is overdue. Please complete the payment to keep your enrollment active.'
+        return f'{count} of your installments totalling {amount} are overdue. Please complete the payment to keep your enrollment active.'
@@ -0,0 +1,178 @@
+import csv
+import multiprocessing
+import os
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from courses.models import Enrollment
+from earnings.ledger import refresh_balances
+from earnings.models import Earning
+from payments.models import Payment, Installment
+
+COMMISSION_RATE = Decimal('0.10')  # Same rate verify_upi_payment applies
+# Stripe checkout (confirm_payment) completes the payment on its first installment and
+# records no earnings, so the installment and earning checks don't apply to it (the
+# refund check does: refunds are only ever made on Stripe payments)
+UNCHECKED_PAYMENT_METHODS = ('stripe',)
+REPORT_FIELDS = ['payment_id', 'student_id', 'issue', 'detail']
+
+
+def _count(queryset, group_field):
+    """Correlated COUNT(*) subquery, 0 when there are no matching rows"""
+    counted = queryset.order_by().values(group_field).annotate(c=Count('id')).values('c')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def reconcile_range(lo, hi, report_path, chunk_size, repair):
+    """Check payments with lo <= id < hi, writing issues to report_path. Runs in a worker process."""
+    issues = {'completed_with_unpaid_installments': 0, 'paid_installment_without_earning': 0,
+              'refunded_with_active_enrollment': 0}
+    reopen_payment_ids = []
+    missing_earnings = []  # (payment_id, earnings already recorded)
+    deactivate_enrollment_ids = []
+
+    payments = (
+        Payment.objects.filter(id__gte=lo, id__lt=hi)
+        .order_by('id')
+        .annotate(
+            unpaid_installments=_count(Installment.objects.filter(payment=OuterRef('pk'), status__in=Installment.UNPAID_STATUSES), 'payment'),
+            paid_installments=_count(Installment.objects.filter(payment=OuterRef('pk'), status='paid'), 'payment'),
+            course_earnings=_count(Earning.objects.filter(course_enrollment=OuterRef('enrollment_id')), 'course_enrollment'),
+            tutor_id=F('course__tutor_id'),
+            enrollment_active=F('enrollment__is_active'),
+        )
+        .values('id', 'student_id', 'payment_method', 'payment_status', 'enrollment_id', 'unpaid_installments',
+                'paid_installments', 'course_earnings', 'tutor_id', 'enrollment_active')
+    )
+
+    with open(report_path, 'w', newline='') as report:
+        writer = csv.writer(report)
+        # Server-side cursors only survive the Supabase transaction pooler inside a transaction
+        with transaction.atomic():
+            for row in payments.iterator(chunk_size=chunk_size):
+                checked = row['payment_method'] not in UNCHECKED_PAYMENT_METHODS
+                if checked and row['payment_status'] == 'completed' and row['unpaid_installments']:
+                    issues['completed_with_unpaid_installments'] += 1
+                    writer.writerow([row['id'], row['student_id'], 'completed_with_unpaid_installments',
+                                     f"{row['unpaid_installments']} unpaid installments"])
+                    reopen_payment_ids.append(row['id'])
+
+                if checked and row['enrollment_id'] and row['tutor_id'] and row['paid_installments'] > row['course_earnings']:
+                    issues['paid_installment_without_earning'] += 1
+                    writer.writerow([row['id'], row['student_id'], 'paid_installment_without_earning',
+                                     f"{row['paid_installments']} paid installments, {row['course_earnings']} earnings"])
+                    missing_earnings.append((row['id'], row['course_earnings']))
+
+                if row['payment_status'] == 'refunded' and row['enrollment_active']:
+                    issues['refunded_with_active_enrollment'] += 1
+                    writer.writerow([row['id'], row['student_id'], 'refunded_with_active_enrollment',
+                                     f"enrollment {row['enrollment_id']} is active"])
+                    deactivate_enrollment_ids.append(row['enrollment_id'])
+
+    if repair:
+        repair_range(reopen_payment_ids, missing_earnings, deactivate_enrollment_ids, chunk_size)
+
+    connections.close_all()
+    return issues
+
+
+def repair_range(reopen_payment_ids, missing_earnings, deactivate_enrollment_ids, chunk_size):
+    # update() skips auto_now; the revenue rollups find changed rows by updated_at
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(reopen_payment_ids), chunk_size):
+            ids = reopen_payment_ids[start:start + chunk_size]
+            Payment.objects.filter(id__in=ids, payment_status='completed').exclude(
+                payment_method__in=UNCHECKED_PAYMENT_METHODS
+            ).update(payment_status='processing', updated_at=now)
+
+        for start in range(0, len(deactivate_enrollment_ids), chunk_size):
+            ids = deactivate_enrollment_ids[start:start + chunk_size]
+            Enrollment.objects.filter(id__in=ids).update(is_active=False)
+
+        for start in range(0, len(missing_earnings), chunk_size):
+            recorded = dict(missing_earnings[start:start + chunk_size])
+            installments = (
+                Installment.objects.filter(payment_id__in=recorded, status='paid')
+                .select_related('payment__course')
+                .order_by('payment_id', 'installment_number')
+            )
+            earnings = []
+            seen = {}
+            for installment in installments:
+                payment = installment.payment
+                # The first N paid installments are assumed to be covered by the N existing earnings
+                seen[payment.id] = seen.get(payment.id, 0) + 1
+                if seen[payment.id] <= recorded[payment.id]:
+                    continue
+                commission = installment.amount * COMMISSION_RATE
+                earnings.append(Earning(
+                    tutor_id=payment.course.tutor_id,
+                    student_id=payment.student_id,
+                    amount=installment.amount,
+                    admin_commission=commission,
+                    net_earning=installment.amount - commission,
+                    source_type='course_enrollment',
+                    course_enrollment_id=payment.enrollment_id,
+                    status='pending'
+                ))
+            Earning.objects.bulk_create(earnings, batch_size=chunk_size)
+            # bulk_create bypasses Earning.save(), so bring the tutors' balances back in line
+            refresh_balances({earning.tutor_id for earning in earnings})
+
+
+def _reconcile_range(args):
+    return reconcile_range(*args)
+
+
+class Command(BaseCommand):
+    help = 'Cross-check payments against installments, enrollments and earnings, optionally repairing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='payment_reconciliation.csv', help='Path of the CSV report')
+        parser.add_argument('--repair', action='store_true', help='Fix detected inconsistencies with bulk updates')
+        parser.add_argument('--workers', type=int, default=1, help='Processes to split the payment id range across')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per cursor round-trip')
+
+    def handle(self, *args, **options):
+        bounds = Payment.objects.aggregate(lo=Min('id'), hi=Max('id'))
+        if bounds['lo'] is None:
+            self.stdout.write('No payments to reconcile')
+            return
+
+        workers = max(1, options['workers'])
+        lo, hi = bounds['lo'], bounds['hi'] + 1
+        step = -(-(hi - lo) // workers)
+        output = options['output']
+        tasks = [
+            (start, min(start + step, hi), f'{output}.part{index}', options['chunk_size'], options['repair'])
+            for index, start in enumerate(range(lo, hi, step))
+        ]
+
+        if len(tasks) == 1:
+            results = [reconcile_range(*tasks[0])]
+        else:
+            # Forked children must not share the parent's database connection
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(len(tasks)) as pool:
+                results = pool.map(_reconcile_range, tasks)
+
+        totals = {}
+        with open(output, 'w', newline='') as report:
+            report.write(','.join(REPORT_FIELDS) + '\r\n')
+            for task, result in zip(tasks, results):
+                with open(task[2], newline='') as part:
+                    for line in part:
+                        report.write(line)
+                os.remove(task[2])
+                for issue, count in result.items():
+                    totals[issue] = totals.get(issue, 0) + count
+
+        for issue, count in totals.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f'{issue}: {count}'))
+        action = 'Repaired' if options['repair'] else 'Reported'
+        self.stdout.write(self.style.SUCCESS(f'{action} {sum(totals.values())} issues, report written to {output}'))
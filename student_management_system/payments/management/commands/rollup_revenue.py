@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payments.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the daily revenue rollups from payments, earnings and refunds changed since the last run (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day from scratch (after hard deletes or schema changes)')
+
+    def handle(self, *args, **options):
+        days = refresh_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt revenue rollups for {days} days'))
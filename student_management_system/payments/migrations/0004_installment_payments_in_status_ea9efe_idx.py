@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payment_consultancy_session_alter_payment_course_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(fields=['status', 'due_date'], name='payments_in_status_ea9efe_idx'),
+        ),
+    ]
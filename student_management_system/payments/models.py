@@ -38,6 +38,12 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset iteration for finance exports
+            models.Index(fields=['created_at', 'id']),
+            # Change scans for the revenue rollups
+            models.Index(fields=['updated_at']),
+        ]
 
 class Installment(models.Model):
     INSTALLMENT_STATUS_CHOICES = (
@@ -46,6 +52,8 @@ class Installment(models.Model):
         ('overdue', 'Overdue'),
         ('cancelled', 'Cancelled'),
     )
+    # Statuses that still expect money from the student
+    UNPAID_STATUSES = ('pending', 'overdue')
     
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='installments')
     installment_number = models.IntegerField()
@@ -63,6 +71,9 @@ class Installment(models.Model):
     class Meta:
         ordering = ['due_date']
         unique_together = ['payment', 'installment_number']
+        indexes = [
+            models.Index(fields=['status', 'due_date']),
+        ]
 
 class Refund(models.Model):
     REFUND_STATUS_CHOICES = (
@@ -87,6 +98,9 @@ class Refund(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
 
 class MoneyBackGuarantee(models.Model):
     enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, related_name='money_back_guarantee')
@@ -101,4 +115,27 @@ class MoneyBackGuarantee(models.Model):
         return f"Money Back Guarantee - {self.enrollment.student.username}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class RevenueRollup(models.Model):
+    """Revenue per day, tutor and course, maintained by payments.rollups (don't edit by hand)"""
+    day = models.DateField()
+    tutor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    payment_count = models.IntegerField(default=0)
+    gmv = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tutor_earnings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refund_count = models.IntegerField(default=0)
+    refunds = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Revenue {self.day} - tutor {self.tutor_id} - course {self.course_id}"
+
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['day']),
+        ]
@@ -0,0 +1,119 @@
+"""
+Daily revenue rollups for the admin dashboard.
+
+Each RevenueRollup row holds one (day, tutor, course) cell:
+- gmv / payment_count: payments captured in full ('completed' or later 'refunded')
+- commission / tutor_earnings: earnings that weren't cancelled
+- refunds / refund_count: completed refunds
+- net: gmv - refunds
+Rows are dated by when the source row was created.
+
+A run finds the days touched by payments, earnings or refunds whose
+updated_at is past the last run's watermark and rebuilds only those days, so
+the work follows the amount of change, not the size of the history. Hard
+deletes don't bump updated_at; run with full=True after bulk deletes.
+queryset.update() doesn't bump it either (auto_now only applies to save()),
+so every bulk update of these tables must set updated_at itself.
+
+The watermark is a JobCheckpoint, which lives in the earnings app.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from earnings.models import Earning, JobCheckpoint
+from .models import Payment, Refund, RevenueRollup
+
+CHECKPOINT_NAME = 'revenue_rollup'
+CAPTURED_PAYMENT_STATUSES = ('completed', 'refunded')
+# Rows committed by transactions still running at the previous watermark
+WATERMARK_OVERLAP = timedelta(minutes=5)
+MEASURES = ('payment_count', 'gmv', 'commission', 'tutor_earnings', 'refund_count', 'refunds')
+
+
+def _created_on(days):
+    """created_at within any of the days, as index-friendly ranges"""
+    condition = Q()
+    for day in days:
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        condition |= Q(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+    return condition
+
+
+def dirty_days(since=None):
+    days = set()
+    for model in (Payment, Earning, Refund):
+        changed = model.objects.all()
+        if since:
+            changed = changed.filter(updated_at__gt=since)
+        days.update(
+            changed.annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+        )
+    return days
+
+
+def aggregate_days(days):
+    """{(day, tutor_id, course_id): measures} computed from the source tables"""
+    cells = {}
+
+    def add(rows, tutor_key, course_key):
+        for row in rows:
+            cell = cells.setdefault((row['day'], row[tutor_key], row[course_key]), {})
+            cell.update({measure: value for measure, value in row.items() if measure in MEASURES})
+
+    payments = Payment.objects.filter(_created_on(days), payment_status__in=CAPTURED_PAYMENT_STATUSES)
+    add(payments.annotate(day=TruncDate('created_at'), tutor_key=Coalesce('course__tutor_id', 'consultancy_session__consultant_id'))
+        .order_by().values('day', 'tutor_key', 'course_id')
+        .annotate(payment_count=Count('id'), gmv=Sum('amount')), 'tutor_key', 'course_id')
+
+    earnings = Earning.objects.filter(_created_on(days)).exclude(status='cancelled')
+    add(earnings.annotate(day=TruncDate('created_at'), course_key=F('course_enrollment__course_id'))
+        .order_by().values('day', 'tutor_id', 'course_key')
+        .annotate(commission=Sum('admin_commission'), tutor_earnings=Sum('net_earning')), 'tutor_id', 'course_key')
+
+    refunds = Refund.objects.filter(_created_on(days), status='completed')
+    add(refunds.annotate(
+            day=TruncDate('created_at'),
+            tutor_key=Coalesce('payment__course__tutor_id', 'payment__consultancy_session__consultant_id'),
+            course_key=F('payment__course_id'),
+        )
+        .order_by().values('day', 'tutor_key', 'course_key')
+        .annotate(refund_count=Count('id'), refunds=Sum('amount')), 'tutor_key', 'course_key')
+
+    return cells
+
+
+def rebuild_days(days):
+    cells = aggregate_days(days)
+    rows = []
+    for (day, tutor_id, course_id), measures in cells.items():
+        values = {measure: measures.get(measure) or 0 for measure in MEASURES}
+        rows.append(RevenueRollup(
+            day=day, tutor_id=tutor_id, course_id=course_id,
+            net=Decimal(values['gmv']) - Decimal(values['refunds']), **values
+        ))
+    with transaction.atomic():
+        RevenueRollup.objects.filter(day__in=days).delete()
+        RevenueRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def refresh_rollups(full=False, chunk_days=31):
+    """Rebuild the days changed since the last run (every day when full=True); returns the number of days"""
+    started = timezone.now()
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    since = None if full or not checkpoint.position_at else checkpoint.position_at - WATERMARK_OVERLAP
+    days = sorted(dirty_days(since))
+
+    with transaction.atomic():
+        if full:
+            # Readers keep seeing the old rows until this transaction commits
+            RevenueRollup.objects.all().delete()
+        for i in range(0, len(days), chunk_days):
+            rebuild_days(days[i:i + chunk_days])
+        checkpoint.position_at = started
+        checkpoint.last_run_at = started
+        checkpoint.save(update_fields=['position_at', 'last_run_at', 'updated_at'])
+    return len(days)
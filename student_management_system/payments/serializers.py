@@ -20,6 +20,24 @@ class PaymentSerializer(serializers.ModelSerializer):
                  'payment_intent_id', 'payment_status', 'transaction_id', 'installments', 'created_at')
         read_only_fields = ('id', 'student', 'payment_status', 'transaction_id', 'created_at')
 
+class PaymentRefundSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Refund
+        fields = ('id', 'amount', 'status', 'created_at')
+        read_only_fields = fields
+
+class BillingPaymentSerializer(serializers.ModelSerializer):
+    """Flat payment row for the billing page; relies on the view prefetching installments and refunds"""
+    course_title = serializers.CharField(source='course.title', read_only=True, default=None)
+    installments = InstallmentSerializer(many=True, read_only=True)
+    refunds = PaymentRefundSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Payment
+        fields = ('id', 'course', 'course_title', 'consultancy_session', 'amount', 'currency', 'payment_method',
+                 'payment_status', 'transaction_id', 'installments', 'refunds', 'created_at')
+        read_only_fields = fields
+
 class RefundSerializer(serializers.ModelSerializer):
     payment = PaymentSerializer(read_only=True)
     processed_by = UserSerializer(read_only=True)
@@ -0,0 +1,164 @@
+"""
+Outbound Stripe calls.
+
+Under daphne every sync view shares one thread, so a view that waited on
+Stripe would stall all HTTP traffic. The calls here are coroutines, awaited
+by the async payment views (student_management.async_views): the SDK call
+runs on a small dedicated thread pool with keep-alive connections while the
+request waits on the event loop, holding no thread. A slow Stripe can only
+tie up the pool, and callers are turned away rather than piling up:
+- at most STRIPE_TIMEOUT seconds per call
+- no wait at all when STRIPE_MAX_CONCURRENCY calls are running and
+  STRIPE_MAX_QUEUED more are waiting, or while the circuit breaker is open
+
+A call that times out while still queued is cancelled. One that already
+went out (timed out, or lost its connection) may still have been carried
+out by Stripe, so every create needs an idempotency key. Callers treat such
+a payment as failed, so create_payment_intent() then replays the request
+with the same key once the original has finished (Stripe answers with
+whatever it created) and cancels that PaymentIntent.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import stripe
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
+# One requests.Session per pool thread, so TLS connections are reused between calls
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=settings.STRIPE_TIMEOUT)
+
+# Errors that say nothing about Stripe's health (bad card, bad params, auth)
+CLIENT_ERRORS = (stripe.error.CardError, stripe.error.InvalidRequestError,
+                 stripe.error.AuthenticationError, stripe.error.PermissionError,
+                 stripe.error.IdempotencyError)
+
+
+class StripeUnavailable(stripe.error.APIConnectionError):
+    """Raised instead of calling Stripe when it is slow, down or the circuit is open"""
+    # The request went out and may have been carried out; `future` is the still running call, if any
+    sent = False
+    future = None
+
+
+def _timed_out(future):
+    error = StripeUnavailable('Payment provider timed out')
+    # A queued call is dropped; a running one can't be stopped
+    if not future.cancel():
+        error.sent, error.future = True, future
+    return error
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let a single probe through once the cool-down has passed
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+executor = ThreadPoolExecutor(max_workers=settings.STRIPE_MAX_CONCURRENCY, thread_name_prefix='stripe')
+breaker = CircuitBreaker(settings.STRIPE_CIRCUIT_FAILURES, settings.STRIPE_CIRCUIT_RESET)
+# Running plus queued calls
+slots = threading.BoundedSemaphore(settings.STRIPE_MAX_CONCURRENCY + settings.STRIPE_MAX_QUEUED)
+
+
+def _submit(func, args, kwargs):
+    if not breaker.allow():
+        raise StripeUnavailable('Payment provider is temporarily unavailable, please retry shortly')
+    if not slots.acquire(blocking=False):
+        raise StripeUnavailable('Payment provider is busy, please retry shortly')
+    try:
+        future = executor.submit(func, *args, **kwargs)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _record(error):
+    if error is None or isinstance(error, CLIENT_ERRORS):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+async def acall(func, *args, **kwargs):
+    """Run a Stripe SDK call on the outbound pool, waiting at most STRIPE_TIMEOUT seconds without blocking the event loop"""
+    future = _submit(func, args, kwargs)
+    try:
+        # shield: the timeout decides itself whether the pool future can still be cancelled
+        result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=settings.STRIPE_TIMEOUT)
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        raise _timed_out(future)
+    except Exception as e:
+        _record(e)
+        raise
+    _record(None)
+    return result
+
+
+def _void_payment_intent(idempotency_key, params):
+    """Cancel whatever PaymentIntent a failed create left behind (replaying it creates one if none was)"""
+    try:
+        intent = stripe.PaymentIntent.create(idempotency_key=idempotency_key, **params)
+        if intent.status != 'canceled':
+            stripe.PaymentIntent.cancel(intent.id)
+    except stripe.error.StripeError:
+        logger.exception('Could not void the PaymentIntent for idempotency key %s', idempotency_key)
+    else:
+        logger.warning('Voided PaymentIntent %s left by a failed create', intent.id)
+
+
+async def create_payment_intent(*, idempotency_key, **params):
+    try:
+        return await acall(stripe.PaymentIntent.create, idempotency_key=idempotency_key, **params)
+    except StripeUnavailable as e:
+        if not e.sent:
+            raise
+        # Replay only after the original finished: Stripe rejects a key that is still in flight
+        e.future.add_done_callback(lambda _: executor.submit(_void_payment_intent, idempotency_key, params))
+        raise
+    except stripe.error.APIConnectionError:
+        # The connection failed mid-request (the HTTP timeout is STRIPE_TIMEOUT too)
+        executor.submit(_void_payment_intent, idempotency_key, params)
+        raise
+
+
+async def retrieve_payment_intent(payment_intent_id):
+    return await acall(stripe.PaymentIntent.retrieve, payment_intent_id)
+
+
+async def create_refund(*, idempotency_key, **params):
+    # A late refund needs no clean-up: the refund stays 'requested' and its retry reuses the key
+    return await acall(stripe.Refund.create, idempotency_key=idempotency_key, **params)
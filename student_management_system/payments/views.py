@@ -3,22 +3,29 @@ from django.conf import settings
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from datetime import timedelta
-from .models import Payment, Installment, Refund, MoneyBackGuarantee
-from .serializers import PaymentSerializer, InstallmentSerializer, RefundSerializer, MoneyBackGuaranteeSerializer, CreatePaymentSerializer, CreateInstallmentSerializer
+from django.utils.dateparse import parse_date
+from django.db.models import Sum, Min, Q, OuterRef, Subquery, DecimalField, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from datetime import datetime, timedelta
+from .models import Payment, Installment, Refund, MoneyBackGuarantee, RevenueRollup
+from .serializers import PaymentSerializer, InstallmentSerializer, RefundSerializer, MoneyBackGuaranteeSerializer, CreatePaymentSerializer, CreateInstallmentSerializer, BillingPaymentSerializer
 from courses.models import Course, Enrollment
 from consultancy.models import ConsultancySession
 from earnings.models import Earning
 from notifications.utils import send_notification
+from . import stripe_client
+from student_management.async_views import AsyncAPIView
+from student_management.streaming import AsyncStreamingHttpResponse
+from .exports import aexport_payments
+from .rollups import CHECKPOINT_NAME as ROLLUP_CHECKPOINT
+from earnings.models import JobCheckpoint
 import qrcode
 import io
 import base64
 
-# Initialize Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def generate_upi_qr(request):
@@ -38,7 +45,7 @@ def generate_upi_qr(request):
                 # Check for unpaid installments
                 payment = Payment.objects.filter(student=request.user, course=course, enrollment=enrollment).first()
                 if payment:
-                    pending_installment = payment.installments.filter(status='pending').order_by('installment_number').first()
+                    pending_installment = payment.installments.filter(status__in=Installment.UNPAID_STATUSES).order_by('installment_number').first()
                     if not pending_installment:
                          return Response({'error': 'Already enrolled and fully paid'}, status=400)
             else:
@@ -72,7 +79,7 @@ def generate_upi_qr(request):
                 Installment.objects.create(payment=payment, installment_number=1, amount=course.fee, due_date=timezone.now(), status='pending')
         
         # Get next pending installment
-        installment = payment.installments.filter(status='pending').order_by('installment_number').first()
+        installment = payment.installments.filter(status__in=Installment.UNPAID_STATUSES).order_by('installment_number').first()
         if not installment:
              return Response({'error': 'No pending installments'}, status=400)
              
@@ -138,13 +145,13 @@ def verify_upi_payment(request):
     
     if payment.payment_status == 'completed':
         # Check if any pending installment exists
-        pending = payment.installments.filter(status='pending').exists()
+        pending = payment.installments.filter(status__in=Installment.UNPAID_STATUSES).exists()
         if not pending:
              return Response({'status': 'success', 'message': 'Payment already verified'})
     
     if payment.enrollment:
         # Get pending installment
-        installment = payment.installments.filter(status='pending').order_by('installment_number').first()
+        installment = payment.installments.filter(status__in=Installment.UNPAID_STATUSES).order_by('installment_number').first()
         if installment:
             installment.status = 'paid'
             installment.paid_date = timezone.now()
@@ -156,7 +163,7 @@ def verify_upi_payment(request):
                 payment.enrollment.save()
             
             # Check if all installments paid
-            if not payment.installments.filter(status='pending').exists():
+            if not payment.installments.filter(status__in=Installment.UNPAID_STATUSES).exists():
                 payment.payment_status = 'completed'
                 payment.save()
             else:
@@ -174,7 +181,7 @@ def verify_upi_payment(request):
                     admin_commission=commission,
                     source_type='course_enrollment',
                     course_enrollment=payment.enrollment,
-                    status='available'
+                    status='pending' # Made available by the clear_earnings job after the hold period
                 )
                 
                 # Notify Tutor
@@ -215,7 +222,7 @@ def verify_upi_payment(request):
                  admin_commission=commission,
                  source_type='consultancy_session',
                  consultancy_session=payment.consultancy_session,
-                 status='available'
+                 status='pending'
              )
 
              # Notify Consultant
@@ -245,169 +252,269 @@ class PaymentListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Payment.objects.filter(student=self.request.user)
+        return Payment.objects.filter(student=self.request.user).select_related(
+            'student', 'course__subject', 'course__tutor'
+        ).prefetch_related('installments', 'course__materials')
 
 class PaymentDetailView(generics.RetrieveAPIView):
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Payment.objects.filter(student=self.request.user)
+        return Payment.objects.filter(student=self.request.user).select_related(
+            'student', 'course__subject', 'course__tutor'
+        ).prefetch_related('installments', 'course__materials')
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def create_payment_intent(request):
-    """Create a Stripe payment intent for course enrollment"""
-    if request.user.user_type != 'student':
-        return Response({
-            'error': 'Only students can make payments'
-        }, status=status.HTTP_403_FORBIDDEN)
+class BillingHistoryView(generics.ListAPIView):
+    """Payments with their installments and refunds in three queries, however long the history"""
+    serializer_class = BillingPaymentSerializer
+    permission_classes = [permissions.IsAuthenticated]
     
-    serializer = CreatePaymentSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def get_queryset(self):
+        return Payment.objects.filter(student=self.request.user).select_related('course').prefetch_related('installments', 'refunds')
+
+def _refund_total(user, statuses):
+    # Consultancy payments share the NULL course row, and NULL = NULL is never true: compare with 0 standing in for NULL
+    refunds = Refund.objects.filter(payment__student=user, status__in=statuses).annotate(
+        course_key=Coalesce('payment__course_id', Value(0))
+    ).filter(
+        course_key=Coalesce(OuterRef('course_id'), Value(0))
+    ).order_by().values('course_key').annotate(total=Sum('amount')).values('total')
+    return Subquery(refunds, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def billing_summary(request):
+    """Outstanding balance, next due installment, per-course totals and refund states in a single query"""
+    unpaid = Q(installments__status__in=Installment.UNPAID_STATUSES)
+    next_due = Installment.objects.filter(
+        payment__student=request.user, payment__course_id=OuterRef('course_id'), status__in=Installment.UNPAID_STATUSES
+    ).order_by('due_date')
     
-    course_id = serializer.validated_data['course_id']
-    payment_method = serializer.validated_data['payment_method']
-    installment_plan = serializer.validated_data['installment_plan']
+    rows = Payment.objects.filter(student=request.user).values('course_id', 'course__title').annotate(
+        billed=Sum('installments__amount'),
+        paid=Sum('installments__amount', filter=Q(installments__status='paid')),
+        outstanding=Sum('installments__amount', filter=unpaid),
+        overdue=Sum('installments__amount', filter=Q(installments__status='overdue')),
+        # Consultancy payments have no installments; they are settled as a whole
+        sessions_paid=Sum('amount', filter=Q(course__isnull=True, payment_status='completed')),
+        next_due_date=Min('installments__due_date', filter=unpaid),
+        next_due_amount=Subquery(next_due.values('amount')[:1]),
+        next_due_installment=Subquery(next_due.values('id')[:1]),
+        refunds_pending=_refund_total(request.user, ['requested', 'processing']),
+        refunds_completed=_refund_total(request.user, ['completed']),
+    ).order_by('course_id')
     
-    course = get_object_or_404(Course, id=course_id, is_active=True)
+    courses = []
+    summary = {'outstanding_balance': 0, 'overdue_balance': 0, 'total_paid': 0, 'next_due': None}
+    for row in rows:
+        paid = (row['paid'] or 0) + (row['sessions_paid'] or 0)
+        courses.append({
+            'course_id': row['course_id'],
+            'course_title': row['course__title'] or 'Consultancy Sessions',
+            'billed': row['billed'] or 0,
+            'paid': paid,
+            'outstanding': row['outstanding'] or 0,
+            'overdue': row['overdue'] or 0,
+            'next_due_date': row['next_due_date'],
+            'refunds_pending': row['refunds_pending'] or 0,
+            'refunds_completed': row['refunds_completed'] or 0,
+        })
+        summary['outstanding_balance'] += row['outstanding'] or 0
+        summary['overdue_balance'] += row['overdue'] or 0
+        summary['total_paid'] += paid
+        if row['next_due_date'] and (not summary['next_due'] or row['next_due_date'] < summary['next_due']['due_date']):
+            summary['next_due'] = {
+                'installment_id': row['next_due_installment'],
+                'course_id': row['course_id'],
+                'course_title': row['course__title'],
+                'due_date': row['next_due_date'],
+                'amount': row['next_due_amount'],
+            }
     
-    # Check if already enrolled
-    if Enrollment.objects.filter(student=request.user, course=course, is_active=True).exists():
+    summary['courses'] = courses
+    return Response(summary)
+
+class CreatePaymentIntentView(AsyncAPIView):
+    """Create a Stripe payment intent for course enrollment"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        if request.user.user_type != 'student':
+            return Response({
+                'error': 'Only students can make payments'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = CreatePaymentSerializer(data=request.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        payment = await sync_to_async(self.start_checkout)(request.user, serializer.validated_data)
+        if payment is None:
+            return Response({
+                'error': 'You are already enrolled in this course'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Create Stripe Payment Intent
+        try:
+            intent = await stripe_client.create_payment_intent(
+                amount=int(payment.amount * 100),  # Stripe expects amount in cents
+                currency='usd',
+                metadata={
+                    'payment_id': payment.id,
+                    'student_id': request.user.id,
+                    'course_id': payment.course_id
+                },
+                idempotency_key=f'payment-intent-{payment.id}'
+            )
+        except stripe_client.StripeUnavailable as e:
+            await sync_to_async(self.fail)(payment)
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except stripe.error.StripeError as e:
+            await sync_to_async(self.fail)(payment)
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        await sync_to_async(self.record_intent)(payment, intent)
         return Response({
-            'error': 'You are already enrolled in this course'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Create enrollment first
-    enrollment = Enrollment.objects.create(
-        student=request.user,
-        course=course
-    )
-    
-    # Create payment
-    payment = Payment.objects.create(
-        student=request.user,
-        course=course,
-        enrollment=enrollment,
-        amount=course.fee,
-        payment_method=payment_method,
-        currency='USD'
-    )
-    
-    if installment_plan:
-        # Create installment plan (50% now, 50% later)
-        half_amount = course.fee / 2
-        
-        # First installment (due now)
-        Installment.objects.create(
-            payment=payment,
-            installment_number=1,
-            amount=half_amount,
-            due_date=timezone.now(),
-            status='pending'
-        )
+            'client_secret': intent.client_secret,
+            'payment_id': payment.id
+        })
+
+    @staticmethod
+    def start_checkout(user, data):
+        """Create the enrollment, payment and installments; None if the student is already enrolled"""
+        course = get_object_or_404(Course, id=data['course_id'], is_active=True)
+        
+        # Check if already enrolled
+        if Enrollment.objects.filter(student=user, course=course, is_active=True).exists():
+            return None
         
-        # Second installment (due in 30 days)
-        Installment.objects.create(
-            payment=payment,
-            installment_number=2,
-            amount=half_amount,
-            due_date=timezone.now() + timedelta(days=30),
-            status='pending'
+        # Create enrollment first
+        enrollment = Enrollment.objects.create(
+            student=user,
+            course=course
         )
-    else:
-        # Single payment
-        Installment.objects.create(
-            payment=payment,
-            installment_number=1,
+        
+        # Create payment
+        payment = Payment.objects.create(
+            student=user,
+            course=course,
+            enrollment=enrollment,
             amount=course.fee,
-            due_date=timezone.now(),
-            status='pending'
-        )
-    
-    # Create Stripe Payment Intent
-    try:
-        intent = stripe.PaymentIntent.create(
-            amount=int(course.fee * 100),  # Stripe expects amount in cents
-            currency='usd',
-            metadata={
-                'payment_id': payment.id,
-                'student_id': request.user.id,
-                'course_id': course.id
-            }
+            payment_method=data['payment_method'],
+            currency='USD'
         )
         
+        if data['installment_plan']:
+            # Create installment plan (50% now, 50% later)
+            half_amount = course.fee / 2
+            
+            # First installment (due now)
+            Installment.objects.create(
+                payment=payment,
+                installment_number=1,
+                amount=half_amount,
+                due_date=timezone.now(),
+                status='pending'
+            )
+            
+            # Second installment (due in 30 days)
+            Installment.objects.create(
+                payment=payment,
+                installment_number=2,
+                amount=half_amount,
+                due_date=timezone.now() + timedelta(days=30),
+                status='pending'
+            )
+        else:
+            # Single payment
+            Installment.objects.create(
+                payment=payment,
+                installment_number=1,
+                amount=course.fee,
+                due_date=timezone.now(),
+                status='pending'
+            )
+        return payment
+
+    @staticmethod
+    def record_intent(payment, intent):
         payment.payment_intent_id = intent.id
         payment.save()
         
         # Create money back guarantee
         MoneyBackGuarantee.objects.create(
-            enrollment=enrollment,
+            enrollment_id=payment.enrollment_id,
             guarantee_expiry_date=timezone.now() + timedelta(days=90)  # 3 months guarantee
         )
-        
-        return Response({
-            'client_secret': intent.client_secret,
-            'payment_id': payment.id
-        })
-        
-    except stripe.error.StripeError as e:
+
+    @staticmethod
+    def fail(payment):
         payment.payment_status = 'failed'
         payment.save()
-        return Response({
-            'error': str(e)
-        }, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def confirm_payment(request):
+class ConfirmPaymentView(AsyncAPIView):
     """Confirm payment after successful Stripe payment"""
-    payment_id = request.data.get('payment_id')
-    payment_intent_id = request.data.get('payment_intent_id')
-    
-    if not payment_id or not payment_intent_id:
-        return Response({
-            'error': 'Payment ID and Payment Intent ID are required'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    payment = get_object_or_404(Payment, id=payment_id, student=request.user)
-    
-    try:
-        # Verify payment with Stripe
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def post(self, request):
+        payment_id = request.data.get('payment_id')
+        payment_intent_id = request.data.get('payment_intent_id')
         
-        if intent.status == 'succeeded':
-            payment.payment_status = 'completed'
-            payment.transaction_id = intent.id
-            payment.save()
-            
-            # Update first installment as paid
-            first_installment = payment.installments.first()
-            if first_installment:
-                first_installment.status = 'paid'
-                first_installment.paid_date = timezone.now()
-                first_installment.transaction_id = intent.id
-                first_installment.save()
-            
-            # Activate enrollment
-            payment.enrollment.is_active = True
-            payment.enrollment.save()
-            
-            serializer = PaymentSerializer(payment)
+        if not payment_id or not payment_intent_id:
             return Response({
-                'message': 'Payment confirmed successfully',
-                'payment': serializer.data
-            })
-        else:
+                'error': 'Payment ID and Payment Intent ID are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        payment = await sync_to_async(get_object_or_404)(
+            Payment.objects.select_related('enrollment'), id=payment_id, student=request.user
+        )
+        
+        try:
+            # Verify payment with Stripe
+            intent = await stripe_client.retrieve_payment_intent(payment_intent_id)
+        except stripe_client.StripeUnavailable as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except stripe.error.StripeError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if intent.status != 'succeeded':
             return Response({
                 'error': 'Payment not completed'
             }, status=status.HTTP_400_BAD_REQUEST)
-            
-    except stripe.error.StripeError as e:
+        
         return Response({
-            'error': str(e)
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'message': 'Payment confirmed successfully',
+            'payment': await sync_to_async(self.complete)(payment, intent)
+        })
+
+    @staticmethod
+    def complete(payment, intent):
+        payment.payment_status = 'completed'
+        payment.transaction_id = intent.id
+        payment.save()
+        
+        # Update first installment as paid
+        first_installment = payment.installments.first()
+        if first_installment:
+            first_installment.status = 'paid'
+            first_installment.paid_date = timezone.now()
+            first_installment.transaction_id = intent.id
+            first_installment.save()
+        
+        # Activate enrollment
+        payment.enrollment.is_active = True
+        payment.enrollment.save()
+        
+        return PaymentSerializer(payment).data
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -450,22 +557,44 @@ def request_refund(request, payment_id):
         'refund': serializer.data
     })
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAdminUser])
-def process_refund(request, refund_id):
+class ProcessRefundView(AsyncAPIView):
     """Process refund (Admin only)"""
-    refund = get_object_or_404(Refund, id=refund_id, status='requested')
-    
-    try:
-        # Process refund through Stripe
-        refund_intent = stripe.Refund.create(
-            payment_intent=refund.payment.payment_intent_id,
-            amount=int(refund.amount * 100)
+    permission_classes = [permissions.IsAdminUser]
+
+    async def post(self, request, refund_id):
+        refund = await sync_to_async(get_object_or_404)(
+            Refund.objects.select_related('payment__enrollment'), id=refund_id, status='requested'
         )
         
+        try:
+            # Process refund through Stripe
+            refund_intent = await stripe_client.create_refund(
+                payment_intent=refund.payment.payment_intent_id,
+                amount=int(refund.amount * 100),
+                idempotency_key=f'refund-{refund.id}'
+            )
+        except stripe_client.StripeUnavailable as e:
+            # Leave the refund in 'requested' so it can simply be retried
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except stripe.error.StripeError as e:
+            refund.status = 'failed'
+            await sync_to_async(refund.save)()
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'message': 'Refund processed successfully',
+            'refund': await sync_to_async(self.complete)(refund, refund_intent, request.user)
+        })
+
+    @staticmethod
+    def complete(refund, refund_intent, admin):
         refund.status = 'completed'
         refund.refund_id = refund_intent.id
-        refund.processed_by = request.user
+        refund.processed_by = admin
         refund.save()
         
         # Update payment status
@@ -481,25 +610,13 @@ def process_refund(request, refund_id):
         refund.payment.enrollment.is_active = False
         refund.payment.enrollment.save()
         
-        serializer = RefundSerializer(refund)
-        return Response({
-            'message': 'Refund processed successfully',
-            'refund': serializer.data
-        })
-        
-    except stripe.error.StripeError as e:
-        refund.status = 'failed'
-        refund.save()
-        return Response({
-            'error': str(e)
-        }, status=status.HTTP_400_BAD_REQUEST)
+        return RefundSerializer(refund).data
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def my_installments(request):
     """Get all installments for current user"""
-    payments = Payment.objects.filter(student=request.user)
-    installments = Installment.objects.filter(payment__in=payments).order_by('due_date')
+    installments = Installment.objects.filter(payment__student=request.user).select_related('payment').order_by('due_date')
     
     serializer = InstallmentSerializer(installments, many=True)
     return Response(serializer.data)
@@ -525,4 +642,90 @@ def job_offer_received(request, enrollment_id):
     except MoneyBackGuarantee.DoesNotExist:
         return Response({
             'error': 'No money back guarantee found for this enrollment'
-        }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        }, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def finance_export(request):
+    """Stream gzipped CSV/JSONL of payments with installments, refunds and earnings (Admin only)"""
+    try:
+        start = parse_date(request.query_params.get('start', ''))
+        end = parse_date(request.query_params.get('end', ''))
+    except ValueError:
+        start = end = None
+    # Not 'format': DRF reserves that query parameter for renderer selection
+    export_format = request.query_params.get('output', 'csv')
+    
+    if not start or not end or end < start:
+        return Response({
+            'error': 'start and end dates (YYYY-MM-DD) are required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if export_format not in ('csv', 'jsonl'):
+        return Response({
+            'error': 'output must be csv or jsonl'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # The end date is inclusive
+    start_at = timezone.make_aware(datetime.combine(start, datetime.min.time()))
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    
+    # Pages are queried as the client reads them, each through sync_to_async
+    response = AsyncStreamingHttpResponse(aexport_payments(start_at, end_at, export_format), content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="payments_{start}_{end}.{export_format}.gz"'
+    return response
+
+# group_by -> (annotations, columns to group on)
+REVENUE_GROUPS = {
+    'day': ({}, ['day']),
+    'month': ({'month': TruncMonth('day')}, ['month']),
+    'tutor': ({}, ['tutor_id', 'tutor__username']),
+    'course': ({}, ['course_id', 'course__title']),
+}
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def revenue_report(request):
+    """Platform revenue from the precomputed daily rollups (Admin only)"""
+    group_by = request.query_params.get('group_by', 'day')
+    if group_by not in REVENUE_GROUPS:
+        return Response({
+            'error': 'group_by must be one of day, month, tutor, course'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    rollups = RevenueRollup.objects.all()
+    try:
+        start = parse_date(request.query_params.get('start', ''))
+        end = parse_date(request.query_params.get('end', ''))
+    except ValueError:
+        start = end = None
+    if (request.query_params.get('start') and not start) or (request.query_params.get('end') and not end):
+        return Response({
+            'error': 'start and end must be valid dates (YYYY-MM-DD)'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    try:
+        tutor_id = int(request.query_params['tutor_id']) if request.query_params.get('tutor_id') else None
+        course_id = int(request.query_params['course_id']) if request.query_params.get('course_id') else None
+    except ValueError:
+        return Response({
+            'error': 'tutor_id and course_id must be integers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if tutor_id:
+        rollups = rollups.filter(tutor_id=tutor_id)
+    if course_id:
+        rollups = rollups.filter(course_id=course_id)
+    
+    measures = {field: Sum(field) for field in ('payment_count', 'gmv', 'commission', 'tutor_earnings', 'refund_count', 'refunds', 'net')}
+    annotations, columns = REVENUE_GROUPS[group_by]
+    rows = rollups.order_by().annotate(**annotations).values(*columns).annotate(**measures).order_by(*columns)
+    checkpoint = JobCheckpoint.objects.filter(name=ROLLUP_CHECKPOINT).first()
+    
+    return Response({
+        'group_by': group_by,
+        'refreshed_at': checkpoint.last_run_at if checkpoint else None,
+        'totals': rollups.aggregate(**measures),
+        'rows': list(rows),
+    })
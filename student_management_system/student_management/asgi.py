@@ -9,21 +9,23 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.urls import re_path
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_management.settings')
 
-django_asgi_app = get_asgi_application()
+django.setup(set_prefix=False)
 
 from .middleware import JwtAuthMiddleware
+from .streaming import ASGIHandler
 from chat import routing as chat_routing
 from notifications import routing as notifications_routing
 
 application = ProtocolTypeRouter(
     {
-        "http": django_asgi_app,
+        # Django's handler, which also streams async generators (see streaming.py)
+        "http": ASGIHandler(),
         "websocket": AllowedHostsOriginValidator(
             JwtAuthMiddleware(
                 URLRouter(
@@ -0,0 +1,38 @@
+"""
+DRF views whose handlers are coroutines.
+
+DRF 3.14 only dispatches to sync handlers, and under daphne every sync view
+runs on one shared thread. AsyncAPIView runs authentication, permission and
+throttle checks (which may query the database) through sync_to_async and
+then awaits the handler on the event loop, so a handler that waits on the
+network (see payments.stripe_client) holds no thread while it waits. Handlers
+must do their own ORM work through sync_to_async.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            # OPTIONS is answered by APIView's sync handler
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
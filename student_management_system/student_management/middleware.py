@@ -1,3 +1,4 @@
+import asyncio
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
@@ -6,6 +7,7 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from urllib.parse import parse_qs
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
 
 User = get_user_model()
 
@@ -43,3 +45,36 @@ class JwtAuthMiddleware(BaseMiddleware):
                 scope["user"] = AnonymousUser()
                 
         return await super().__call__(scope, receive, send)
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs as async middleware.
+
+    WhiteNoise itself is sync only, which makes Django run everything after
+    it, async views included, on the one thread daphne shares between sync
+    views. Under ASGI this serves static files the same way and awaits the
+    rest of the chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Tells Django this instance is async (as MiddlewareMixin does)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,125 @@
+"""
+Token-bucket rate limits for incoming websocket frames.
+
+Every frame a client sends to a consumer is checked against two limits:
+- per connection: an in-process token bucket (WS_RATE_LIMIT_PER_SECOND
+  tokens per second, up to WS_RATE_LIMIT_BURST saved up), no I/O at all
+- per user: WS_USER_RATE_LIMIT_PER_SECOND frames per second across all of
+  the user's connections on every worker, counted in the shared cache
+  (Redis when REDIS_URL is set). Connections lease tokens from the
+  current one-second window: one for their first frame in a window, then
+  twice as many each time they run out, up to WS_USER_RATE_LIMIT_LEASE. A
+  busy connection hits the cache once per few frames, while the many
+  connections that only send a heartbeat hold one token each. Tokens left
+  unused are given back when the connection closes.
+
+Frames over either limit are dropped, and the client is sent
+{"action": "rate_limited"} once each time it starts being dropped. Dropped
+frames drain a second bucket of the same size; a client that keeps sending at
+more than twice its limit is disconnected with close code 4429.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+CLOSE_CODE = 4429
+
+ALLOW, DROP, CLOSE = 'allow', 'drop', 'close'
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SharedBudget:
+    """A user's frames per second across processes, as a counter per one-second window in the cache"""
+
+    def __init__(self, user_id, rate, max_lease):
+        self.key = f'ws_rate:user:{user_id}'
+        self.rate = rate
+        self.max_lease = max(1, min(max_lease, rate))
+        self.window = None
+        self.lease = 1
+        self.leased = 0
+
+    async def take(self):
+        window = int(time.time())
+        if window != self.window:
+            # Unused tokens don't carry over into the next window
+            self.window, self.lease, self.leased = window, 1, 0
+        if self.leased:
+            self.leased -= 1
+            return True
+
+        key = f'{self.key}:{window}'
+        lease = self.lease
+        await cache.aadd(key, 0, 2)
+        try:
+            used = await cache.aincr(key, lease)
+        except ValueError:
+            # Expired between add and incr
+            await cache.aset(key, lease, 2)
+            used = lease
+        available = self.rate - (used - lease)
+        if available <= 0:
+            return False
+        granted = min(lease, available)
+        if granted < lease:
+            # Don't hold on to the part of the reservation that was over the limit
+            await self._give_back(key, lease - granted)
+        self.leased = granted - 1
+        self.lease = min(lease * 2, self.max_lease)
+        return True
+
+    async def release(self):
+        """Give back this window's unused tokens (the connection is closing)"""
+        if self.leased and self.window == int(time.time()):
+            await self._give_back(f'{self.key}:{self.window}', self.leased)
+        self.leased = 0
+
+    async def _give_back(self, key, tokens):
+        try:
+            await cache.adecr(key, tokens)
+        except ValueError:
+            # The window is over already
+            pass
+
+
+class FrameLimiter:
+    """The limits for one connection"""
+
+    def __init__(self, user_id):
+        rate = getattr(settings, 'WS_RATE_LIMIT_PER_SECOND', 10)
+        burst = getattr(settings, 'WS_RATE_LIMIT_BURST', 30)
+        self.connection = TokenBucket(rate, burst)
+        self.overflow = TokenBucket(rate, burst)
+        user_rate = getattr(settings, 'WS_USER_RATE_LIMIT_PER_SECOND', 30)
+        self.user = SharedBudget(user_id, user_rate, getattr(settings, 'WS_USER_RATE_LIMIT_LEASE', 5)) if user_rate else None
+        self.dropped = 0
+        # Frames dropped since the last one let through
+        self.dropping = 0
+
+    async def check(self):
+        if self.connection.take() and (self.user is None or await self.user.take()):
+            self.dropping = 0
+            return ALLOW
+        self.dropped += 1
+        self.dropping += 1
+        return DROP if self.overflow.take() else CLOSE
+
+    async def release(self):
+        if self.user:
+            await self.user.release()
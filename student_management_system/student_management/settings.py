@@ -47,7 +47,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'student_management.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -123,6 +123,57 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# Cache (shared Redis in production, per-process memory otherwise)
+REDIS_URL = env('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Channel layer for websocket groups (must be Redis when running more than one worker)
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Websocket chat messages are inserted in batches (see chat.buffer)
+CHAT_WRITE_BATCH_SIZE = env.int('CHAT_WRITE_BATCH_SIZE', default=100)
+CHAT_WRITE_FLUSH_MS = env.int('CHAT_WRITE_FLUSH_MS', default=20)
+CHAT_DURABLE_BEFORE_ACK = env.bool('CHAT_DURABLE_BEFORE_ACK', default=False)
+PRESENCE_TTL = env.int('PRESENCE_TTL', default=60)
+PRESENCE_BROADCAST_MS = env.int('PRESENCE_BROADCAST_MS', default=1000)
+CHAT_ARCHIVE_AFTER_DAYS = env.int('CHAT_ARCHIVE_AFTER_DAYS', default=180)
+VIDEO_ICE_BATCH_MS = env.int('VIDEO_ICE_BATCH_MS', default=25)
+CALL_ANALYTICS_CACHE_SECONDS = env.int('CALL_ANALYTICS_CACHE_SECONDS', default=600)
+CALL_RING_TIMEOUT_SECONDS = env.int('CALL_RING_TIMEOUT_SECONDS', default=60)
+CALL_MAX_DURATION_SECONDS = env.int('CALL_MAX_DURATION_SECONDS', default=4 * 3600)
+# Incoming websocket frames per connection and per user (see student_management.ratelimit)
+WS_RATE_LIMIT_PER_SECOND = env.int('WS_RATE_LIMIT_PER_SECOND', default=10)
+WS_RATE_LIMIT_BURST = env.int('WS_RATE_LIMIT_BURST', default=30)
+WS_USER_RATE_LIMIT_PER_SECOND = env.int('WS_USER_RATE_LIMIT_PER_SECOND', default=30)
+WS_USER_RATE_LIMIT_LEASE = env.int('WS_USER_RATE_LIMIT_LEASE', default=5)
+# Cached room participants for authorization (see chat.membership)
+ROOM_MEMBERSHIP_CACHE_SECONDS = env.int('ROOM_MEMBERSHIP_CACHE_SECONDS', default=300)
+ROOM_MEMBERSHIP_LOCAL_SECONDS = env.int('ROOM_MEMBERSHIP_LOCAL_SECONDS', default=5)
+
 # whitenoise
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -246,6 +297,21 @@ CONTACT_RECIPIENT_EMAIL = env('CONTACT_RECIPIENT_EMAIL', default='contact@edusys
 STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+# Point at `python manage.py fake_stripe_server` for local testing and benchmarks
+STRIPE_API_BASE = env('STRIPE_API_BASE', default='')
+# Outbound Stripe calls (see payments/stripe_client.py)
+STRIPE_TIMEOUT = env.float('STRIPE_TIMEOUT', default=10)
+STRIPE_MAX_CONCURRENCY = env.int('STRIPE_MAX_CONCURRENCY', default=8)
+STRIPE_MAX_QUEUED = env.int('STRIPE_MAX_QUEUED', default=8)
+STRIPE_CIRCUIT_FAILURES = env.int('STRIPE_CIRCUIT_FAILURES', default=5)
+STRIPE_CIRCUIT_RESET = env.float('STRIPE_CIRCUIT_RESET', default=30)
+
+# Earnings stay pending this many days before tutors can withdraw them
+# (longer while the enrollment's money back guarantee is still open)
+EARNING_HOLD_DAYS = env.int('EARNING_HOLD_DAYS', default=7)
+# Closed earnings time series buckets are cached this long (see earnings.analytics).
+# Keep it finite: invalidation only reaches other workers through a shared cache
+EARNINGS_TIMESERIES_CACHE_SECONDS = env.int('EARNINGS_TIMESERIES_CACHE_SECONDS', default=3600)
 
 if not DEBUG and (not STRIPE_PUBLISHABLE_KEY or not STRIPE_SECRET_KEY):
     # Log a warning instead of crashing if possible, or handle it in views
@@ -0,0 +1,79 @@
+"""
+Streaming responses produced by async generators.
+
+Django 4.1 only streams sync iterators, and under ASGI it iterates them on
+the event loop, where the ORM refuses to run. An AsyncStreamingHttpResponse
+wraps an async generator instead, which can fetch each piece of its content
+with sync_to_async: the shared sync thread is only held for one query at a
+time and the loop keeps serving other requests between pieces.
+
+The ASGIHandler here (used by asgi.py) sends such responses as they are
+produced. Under WSGI the response is drained one piece at a time on a
+private event loop. Django 4.2 supports async iterators in StreamingHttpResponse
+itself; this can go once the project is on it.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    def _set_streaming_content(self, value):
+        # Wrappers set by sync code (the test client, middleware) are plain iterators
+        self.is_async = hasattr(value, '__aiter__')
+        if not self.is_async:
+            return super()._set_streaming_content(value)
+        self._iterator = aiter(value)
+
+    @property
+    def streaming_content(self):
+        if not self.is_async:
+            return map(self.make_bytes, self._iterator)
+        return self._drain(self._iterator)
+
+    def _drain(self, iterator):
+        # Sync consumers (WSGI, the test client). One loop for the whole body:
+        # async_to_sync would start a new one per piece and close the
+        # generator when the first of them shut down.
+        loop = asyncio.new_event_loop()
+        try:
+            while (part := loop.run_until_complete(anext(iterator, None))) is not None:
+                yield self.make_bytes(part)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._set_streaming_content(value)
+
+    def __iter__(self):
+        return self.streaming_content
+
+    async def __aiter__(self):
+        async for part in self._iterator:
+            yield self.make_bytes(part)
+
+
+class ASGIHandler(BaseASGIHandler):
+    async def send_response(self, response, send):
+        if not getattr(response, 'is_async', False):
+            return await super().send_response(response, send)
+
+        # As the base class does for sync streaming responses
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+        async for part in response:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,99 @@
+"""
+Websocket frame encodings shared by the chat, video call and notification consumers.
+
+Clients pick an encoding with the websocket subprotocol: `msgpack` gets
+binary MessagePack frames, `json` (or no subprotocol, for older clients)
+gets JSON text frames. Group events are encoded once by whoever sends them
+(`with_frames`), carrying one ready frame per encoding, so a consumer just
+forwards the frame for its connection instead of serializing per recipient.
+
+permessage-deflate is negotiated by the ASGI server, not here: uvicorn
+enables it by default, daphne does not offer it.
+
+Incoming frames are rate limited per connection and per user
+(student_management.ratelimit); consumers call within_rate_limit() first
+thing in receive().
+"""
+import json
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+from .ratelimit import ALLOW, CLOSE, CLOSE_CODE, FrameLimiter
+
+# Server preference when a client offers several
+ENCODINGS = ('msgpack', 'json')
+
+
+def _msgpack_default(value):
+    # Same fallbacks as the JSON side (datetimes, decimals, UUIDs...)
+    return json.loads(DjangoJSONEncoder().encode(value))
+
+
+def encode(payload, encoding):
+    if encoding == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True, default=_msgpack_default)
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+def encode_frames(payload):
+    return {encoding: encode(payload, encoding) for encoding in ENCODINGS}
+
+
+def with_frames(event, build_payload):
+    """Add the client frames for build_payload(event) to a channel layer event, encoded once for every client type"""
+    return {**event, 'frames': encode_frames(build_payload(event))}
+
+
+class EncodedWebsocketMixin:
+    """For AsyncWebsocketConsumer subclasses: negotiated accept, encoded send and decoded receive"""
+    encoding = 'json'
+
+    async def accept_negotiated(self):
+        offered = self.scope.get('subprotocols') or []
+        subprotocol = next((encoding for encoding in ENCODINGS if encoding in offered), None)
+        self.encoding = subprotocol or 'json'
+        await self.accept(subprotocol=subprotocol)
+
+    async def send_payload(self, payload):
+        await self.send_frame(encode(payload, self.encoding))
+
+    async def send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def send_event(self, event, build_payload):
+        """Forward a pre-encoded group event, or encode build_payload(event) for events sent the old way"""
+        frames = event.get('frames')
+        if frames and self.encoding in frames:
+            await self.send_frame(frames[self.encoding])
+        else:
+            await self.send_payload(build_payload(event))
+
+    async def within_rate_limit(self):
+        """False if this frame is over the limit and must be ignored; closes connections that keep flooding"""
+        limiter = getattr(self, 'frame_limiter', None)
+        if limiter is None:
+            limiter = self.frame_limiter = FrameLimiter(self.scope['user'].id)
+        verdict = await limiter.check()
+        if verdict == ALLOW:
+            return True
+        if verdict == CLOSE:
+            if not getattr(self, 'rate_limit_closed', False):
+                self.rate_limit_closed = True
+                await self.close(code=CLOSE_CODE)
+        elif limiter.dropping == 1:
+            # Tell the client once per run of dropped frames, so it can back off and resend
+            await self.send_payload({'action': 'rate_limited'})
+        return False
+
+    async def release_rate_limit(self):
+        """Call from disconnect(): gives the user's unused rate limit tokens back"""
+        limiter = getattr(self, 'frame_limiter', None)
+        if limiter:
+            await limiter.release()
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data, raw=False)
+        return json.loads(text_data)